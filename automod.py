@@ -0,0 +1,254 @@
+"""Automod checks run on every guild message: spam and channel floods, mention and invite floods, and a
+per-guild word filter.
+
+Each check costs the same however busy the guild is: rates are kept in fixed-size bucketed windows, and
+the word filter matches all of a guild's words in one pass over the message. Per-user and per-channel
+state lives in maps capped at AUTOMOD_MAX_TRACKED keys, dropping the least recently active first.
+"""
+import os
+import re
+import time
+from collections import OrderedDict, deque
+from dotenv import load_dotenv
+from guild_settings import settings
+import metrics
+import logging
+
+log = logging.getLogger(__name__)
+
+load_dotenv()
+
+SPAM_MESSAGES = int(os.getenv("AUTOMOD_SPAM_MESSAGES", 6))  # Messages one member may send per SPAM_WINDOW
+SPAM_WINDOW = float(os.getenv("AUTOMOD_SPAM_WINDOW", 5))  # Seconds
+FLOOD_MESSAGES = int(os.getenv("AUTOMOD_FLOOD_MESSAGES", 40))  # Messages one channel may take per FLOOD_WINDOW
+FLOOD_WINDOW = float(os.getenv("AUTOMOD_FLOOD_WINDOW", 10))  # Seconds
+FLOOD_SLOWMODE = int(os.getenv("AUTOMOD_FLOOD_SLOWMODE", 10))  # Slowmode seconds applied to a flooded channel
+FLOOD_SLOWMODE_MINUTES = int(os.getenv("AUTOMOD_FLOOD_SLOWMODE_MINUTES", 5))
+MENTION_LIMIT = int(os.getenv("AUTOMOD_MENTION_LIMIT", 8))  # Most distinct users and roles one message may mention
+INVITE_LIMIT = int(os.getenv("AUTOMOD_INVITE_LIMIT", 3))  # Invite links one member may post per INVITE_WINDOW
+INVITE_WINDOW = float(os.getenv("AUTOMOD_INVITE_WINDOW", 60))  # Seconds
+STRIKE_WINDOW = float(os.getenv("AUTOMOD_STRIKE_WINDOW", 600))  # Seconds a violation counts towards escalation
+MAX_TRACKED = int(os.getenv("AUTOMOD_MAX_TRACKED", 100_000))  # Keys kept per rate tracker
+WINDOW_BUCKETS = 10  # Resolution of every window: a tenth of its length
+
+ACTIONS = ("warn", "mute", "kick", "ban")
+DEFAULT_RULES = "3:warn 5:mute:10 8:kick"
+MAX_RULES = 10
+MAX_RULES_LENGTH = 255  # Size of the guild_settings.automod_rules column
+INVITE_PATTERN = re.compile(r"(?:discord(?:app)?\.com/invite|discord\.gg)/[\w-]+", re.IGNORECASE)
+RULE_PATTERN = re.compile(r"(\d+):(warn|mute|kick|ban)(?::(\d+))?")
+
+VIOLATIONS = metrics.Counter("bot_automod_violations_total", "Messages that failed an automod check.", ["check"])
+
+
+class WindowCounter:
+    """Events over the last `buckets` ticks. Adding costs at most one pass over the buckets."""
+    __slots__ = ("counts", "total", "tick")
+
+    def __init__(self, buckets, tick):
+        self.counts = [0] * buckets
+        self.total = 0
+        self.tick = tick
+
+    def add(self, tick, amount=1):
+        buckets = len(self.counts)
+        elapsed = tick - self.tick
+        if elapsed >= buckets:
+            self.counts = [0] * buckets
+            self.total = 0
+        else:
+            # Empty the buckets that slid out of the window since the last event
+            for step in range(1, elapsed + 1):
+                index = (self.tick + step) % buckets
+                self.total -= self.counts[index]
+                self.counts[index] = 0
+        self.tick = max(self.tick, tick)
+        self.counts[tick % buckets] += amount
+        self.total += amount
+        return self.total
+
+
+class RateTracker:
+    """Sliding-window event counts for many keys, keeping only the `maxsize` most recently active.
+
+    A key is only dropped once `maxsize` newer keys have been active since, so with a generous size
+    only counts that have long gone quiet are lost.
+    """
+
+    def __init__(self, window, buckets=WINDOW_BUCKETS, maxsize=MAX_TRACKED):
+        self.resolution = window / buckets
+        self.buckets = buckets
+        self.maxsize = maxsize
+        self._counters = OrderedDict()  # key -> WindowCounter, least recently active first
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._counters)
+
+    def add(self, key, now, amount=1):
+        """Records `amount` events for `key` at monotonic time `now`. Returns the count in the window."""
+        tick = int(now / self.resolution)
+        counter = self._counters.get(key)
+        if counter is None:
+            counter = self._counters[key] = WindowCounter(self.buckets, tick)
+            if len(self._counters) > self.maxsize:
+                self._counters.popitem(last=False)
+                self.evictions += 1
+        else:
+            self._counters.move_to_end(key)
+        return counter.add(tick, amount)
+
+
+class WordFilter:
+    """Finds any of a set of words or phrases in a message with one pass (an Aho-Corasick automaton).
+
+    Matching is case-insensitive and on whole words only, so "ass" doesn't match "class".
+    """
+
+    def __init__(self, words):
+        self._goto = [{}]  # state -> {char: next state}
+        self._fail = [0]  # state -> longest proper suffix that is also a state
+        self._out = [()]  # state -> lengths of the words that end here
+        for word in {word.strip().lower() for word in words}:
+            if not word:
+                continue
+            state = 0
+            for char in word:
+                following = self._goto[state].get(char)
+                if following is None:
+                    following = self._goto[state][char] = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                state = following
+            self._out[state] = (len(word),)
+
+        # Failure links, breadth first so every shorter suffix is linked before it is needed
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, following in self._goto[state].items():
+                queue.append(following)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[following] = self._goto[fail].get(char, 0)
+                self._out[following] += self._out[self._fail[following]]
+
+    def __bool__(self):
+        return len(self._goto) > 1
+
+    def find(self, text):
+        """Returns the first filtered word in `text` (lowercased already), or None."""
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for end, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length in out[state]:
+                start = end - length + 1
+                if (start == 0 or not text[start - 1].isalnum()) and (end + 1 == len(text) or not text[end + 1].isalnum()):
+                    return text[start:end + 1]
+        return None
+
+
+def split_words(text):
+    """Splits a comma or newline separated word list."""
+    return [word.strip() for word in re.split(r"[,\n]", text or "") if word.strip()]
+
+
+def parse_rules(text):
+    """Parses escalation rules like `3:warn 5:mute:10 8:kick` into {strikes: (action, minutes)}.
+
+    Raises ValueError on a malformed rule, or on more rules than fit the settings column.
+    """
+    rules = {}
+    for part in text.replace(",", " ").split():
+        match = RULE_PATTERN.fullmatch(part.lower())
+        if not match or int(match.group(1)) < 1:
+            raise ValueError(f"Invalid rule `{part}`; use strikes:action[:minutes], e.g. `5:mute:10`.")
+        minutes = int(match.group(3)) if match.group(3) else None
+        rules[int(match.group(1))] = (match.group(2), minutes)
+    if len(rules) > MAX_RULES:
+        raise ValueError(f"Too many rules; use at most {MAX_RULES}.")
+    if len(format_rules(rules)) > MAX_RULES_LENGTH:
+        raise ValueError(f"The rules are too long; keep them under {MAX_RULES_LENGTH} characters.")
+    return rules
+
+
+def format_rules(rules):
+    return " ".join(
+        f"{strikes}:{action}" + (f":{minutes}" if minutes else "") for strikes, (action, minutes) in sorted(rules.items())
+    )
+
+
+class AutoMod:
+    """Per-process automod state: the rate trackers and each guild's compiled word filter and rules."""
+
+    def __init__(self):
+        self.spam = RateTracker(SPAM_WINDOW)
+        self.floods = RateTracker(FLOOD_WINDOW)
+        self.invites = RateTracker(INVITE_WINDOW)
+        self.strikes = RateTracker(STRIKE_WINDOW)
+        self._filters = {}  # guild_id -> WordFilter, compiled on first use
+        self._rules = {}  # guild_id -> parsed escalation rules
+
+    def word_filter(self, guild_id):
+        word_filter = self._filters.get(guild_id)
+        if word_filter is None:
+            word_filter = self._filters[guild_id] = WordFilter(split_words(settings.get(guild_id, "automod_words")))
+        return word_filter
+
+    def rules(self, guild_id):
+        rules = self._rules.get(guild_id)
+        if rules is None:
+            text = settings.get(guild_id, "automod_rules", DEFAULT_RULES)
+            try:
+                rules = parse_rules(text)
+            except ValueError:
+                log.warning(f"Guild {guild_id} has invalid automod rules {text!r}; using the defaults.")
+                rules = parse_rules(DEFAULT_RULES)
+            self._rules[guild_id] = rules
+        return rules
+
+    def invalidate(self, guild_id):
+        """Drops a guild's compiled filter and rules after its settings change."""
+        self._filters.pop(guild_id, None)
+        self._rules.pop(guild_id, None)
+
+    def check(self, message, now=None):
+        """Runs a guild message through every check.
+
+        Returns (reason, flooded): why the message breaks the rules (None if it doesn't), and whether
+        its channel is taking more than FLOOD_MESSAGES per FLOOD_WINDOW.
+        """
+        now = time.monotonic() if now is None else now
+        key = (message.guild.id, message.author.id)
+        flooded = self.floods.add(message.channel.id, now) > FLOOD_MESSAGES
+
+        if self.spam.add(key, now) > SPAM_MESSAGES:
+            return self._violation("spam", "sending messages too fast"), flooded
+
+        mentions = len(set(message.raw_mentions)) + len(set(message.raw_role_mentions))
+        if mentions > MENTION_LIMIT:
+            return self._violation("mentions", f"mentioning {mentions} users or roles at once"), flooded
+
+        text = message.content.lower()
+        if "discord" in text:
+            invites = len(INVITE_PATTERN.findall(text))
+            if invites and self.invites.add(key, now, invites) > INVITE_LIMIT:
+                return self._violation("invites", "posting too many invite links"), flooded
+
+        word_filter = self.word_filter(message.guild.id)
+        if word_filter and word_filter.find(text) is not None:
+            return self._violation("words", "using a filtered word"), flooded
+        return None, flooded
+
+    def _violation(self, check, reason):
+        VIOLATIONS.inc(check)
+        return reason
+
+    def add_strike(self, guild_id, user_id, now=None):
+        """Counts a violation against a member. Returns their strikes within STRIKE_WINDOW."""
+        return self.strikes.add((guild_id, user_id), time.monotonic() if now is None else now)
@@ -0,0 +1,480 @@
+"""Offline benchmarks: drives the real cogs with fake Discord objects on the SQLite storage backend.
+
+Usage: python bench.py [scenario ...] [--http-latency MS] [--save] [--compare] [--baseline PATH]
+
+No token or database server is needed. Every Discord call (send, ban, bulk_ban, edit...) is a fake
+coroutine that sleeps for --http-latency, and each scenario gets a fresh, migrated SQLite database in a
+temporary directory, so the real buffering, caching, query and writer-thread code in db.py is measured.
+--save writes the results to the baseline file and --compare prints the change against it.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+import discord
+import db
+import automod
+import boosters
+from boosters import Boosters
+from giveaway import Giveaway
+from moderation import ModerationCog, MassActionFlags
+from guild_settings import settings
+
+BASELINE_PATH = "bench_baseline.json"
+GUILD_ID = 1 << 22  # Shard 0 of any shard count
+
+class FakeHTTP:
+    """Stands in for Discord's REST API: every call just costs `latency` seconds."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+
+    async def request(self):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        else:
+            await asyncio.sleep(0)  # Still yield, like a real request would
+
+
+class FakeUser:
+    def __init__(self, user_id, http, guild=None, bot=False):
+        self.id = user_id
+        self.name = f"user{user_id}"
+        self.display_name = self.name
+        self.mention = f"<@{user_id}>"
+        self.bot = bot
+        self.guild = guild
+        self.joined_at = None
+        self.premium_since = None
+        self.roles = []
+        self.top_role = 0
+        self.guild_permissions = discord.Permissions.none()
+        self._http = http
+
+    async def ban(self, **kwargs):
+        await self._http.request()
+
+    async def kick(self, **kwargs):
+        await self._http.request()
+
+    async def add_roles(self, *roles, **kwargs):
+        await self._http.request()
+
+    def __str__(self):
+        return self.name
+
+
+class FakeMessage:
+    _ids = itertools.count(10_000)
+
+    def __init__(self, channel, content=None, embed=None, author=None):
+        self.id = next(self._ids)
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+        self.embed = embed
+        self.raw_mentions = []
+        self.raw_role_mentions = []
+
+    async def edit(self, **kwargs):
+        await self.channel._http.request()
+
+    async def add_reaction(self, emoji):
+        await self.channel._http.request()
+
+    async def delete(self):
+        await self.channel._http.request()
+
+
+class FakeChannel:
+    def __init__(self, channel_id, guild, http):
+        self.id = channel_id
+        self.guild = guild
+        self.mention = f"<#{channel_id}>"
+        self.slowmode_delay = 0
+        self._http = http
+        self.sent = 0
+
+    async def edit(self, **kwargs):
+        await self._http.request()
+        self.slowmode_delay = kwargs.get("slowmode_delay", self.slowmode_delay)
+
+    async def send(self, content=None, *, embed=None, **kwargs):
+        await self._http.request()
+        self.sent += 1
+        return FakeMessage(self, content, embed)
+
+
+class BulkBanResult:
+    def __init__(self, banned):
+        self.banned = banned
+        self.failed = []
+
+
+class FakeGuild:
+    def __init__(self, guild_id, http, member_count=0):
+        self.id = guild_id
+        self.name = f"guild{guild_id}"
+        self.owner_id = 1
+        self.owner = None
+        self.roles = []
+        self._http = http
+        self._members = {}
+        for user_id in range(100, 100 + member_count):
+            self._members[user_id] = FakeUser(user_id, http, guild=self)
+        self.channel = FakeChannel(guild_id + 1, self, http)
+
+    @property
+    def members(self):
+        return list(self._members.values())
+
+    @property
+    def premium_subscribers(self):
+        return [member for member in self._members.values() if member.premium_since]
+
+    def get_member(self, user_id):
+        return self._members.get(user_id)
+
+    def get_role(self, role_id):
+        return None
+
+    async def bulk_ban(self, users, **kwargs):
+        await self._http.request()
+        return BulkBanResult(list(users))
+
+    async def query_members(self, user_ids=None, **kwargs):
+        await self._http.request()
+        return [self._members[user_id] for user_id in user_ids if user_id in self._members]
+
+
+class FakeBot:
+    shard_count = None
+    shard_ids = None
+
+    def __init__(self, guilds):
+        self.user = FakeUser(2, None, bot=True)
+        self.loop = asyncio.get_running_loop()
+        self.guilds = guilds
+        self._channels = {guild.channel.id: guild.channel for guild in guilds}
+
+    def get_guild(self, guild_id):
+        return next((guild for guild in self.guilds if guild.id == guild_id), None)
+
+    def get_channel(self, channel_id):
+        return self._channels.get(channel_id)
+
+    async def wait_until_ready(self):
+        return
+
+
+class FakeContext:
+    def __init__(self, bot, guild, author):
+        self.bot = bot
+        self.guild = guild
+        self.author = author
+        self.channel = guild.channel
+        self.message = FakeMessage(guild.channel)
+
+    async def send(self, content=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+
+class ReactionPayload:
+    def __init__(self, message_id, user_id, emoji):
+        self.message_id = message_id
+        self.user_id = user_id
+        self.emoji = emoji
+        self.member = None
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = max(math.ceil(pct / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[index]
+
+
+class Recorder:
+    """Collects per-operation latencies for one scenario."""
+
+    def __init__(self):
+        self.latencies = []
+        self.started = None
+        self.elapsed = None
+
+    async def time(self, coro):
+        started = time.perf_counter()
+        result = await coro
+        self.latencies.append(time.perf_counter() - started)
+        return result
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.started
+
+    def result(self):
+        latencies = sorted(self.latencies)
+        return {
+            "ops": len(latencies),
+            "seconds": round(self.elapsed, 4),
+            "ops_per_sec": round(len(latencies) / self.elapsed, 1) if self.elapsed else 0.0,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 4),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 4),
+        }
+
+
+# Scenarios
+
+async def bench_ban_burst(http, count=1000):
+    """`ban` invoked `count` times at once: REST call, buffered infraction, reply; then the flush."""
+    guild = FakeGuild(GUILD_ID, http, member_count=count)
+    bot = FakeBot([guild])
+    cog = ModerationCog(bot)
+    ctx = FakeContext(bot, guild, FakeUser(3, http, guild=guild))
+    recorder = Recorder()
+    with recorder:
+        await asyncio.gather(*(
+            recorder.time(cog.ban.callback(cog, ctx, member, reason="Raid."))
+            for member in guild.members
+        ))
+        await db.infraction_buffer.flush()
+    return recorder.result()
+
+
+async def bench_massban(http, count=1000):
+    """One `massban` over `count` IDs: target resolution, bulk_ban chunks, infraction batch, summary."""
+    guild = FakeGuild(GUILD_ID, http, member_count=count)
+    bot = FakeBot([guild])
+    cog = ModerationCog(bot)
+    ctx = FakeContext(bot, guild, FakeUser(3, http, guild=guild))
+    flags = MassActionFlags.__new__(MassActionFlags)
+    flags.ids = " ".join(str(member.id) for member in guild.members)
+    flags.joined, flags.name, flags.reason = None, None, "Raid."
+    recorder = Recorder()
+    with recorder:
+        for _ in range(5):
+            await recorder.time(cog.massban.callback(cog, ctx, flags=flags))
+        await db.infraction_buffer.flush()
+    return recorder.result()
+
+
+async def _giveaway_with_entrants(http, count):
+    guild = FakeGuild(GUILD_ID, http)
+    bot = FakeBot([guild])
+    cog = Giveaway(bot)
+    message_id = next(FakeMessage._ids)
+    cog.active_giveaways[message_id] = {
+        "guild": guild.id,
+        "channel": guild.channel.id,
+        "ends_at": discord.utils.utcnow() + timedelta(hours=1),
+        "winners": 3,
+        "emojis": ["🎉", "🎁"],
+        "prize": "Nitro",
+        "entrants": {},
+        "reconciled": True,
+    }
+    return cog, message_id
+
+
+async def bench_giveaway_reactions(http, count=100_000):
+    """`count` reaction adds on one giveaway, then the checkpoint that writes them all."""
+    cog, message_id = await _giveaway_with_entrants(http, count)
+    recorder = Recorder()
+    with recorder:
+        for user_id in range(100, 100 + count):
+            await recorder.time(cog.on_raw_reaction_add(ReactionPayload(message_id, user_id, "🎉")))
+        await cog.checkpoint_entrants()
+    result = recorder.result()
+    result["entrants"] = len(cog.active_giveaways[message_id]["entrants"])
+    return result
+
+
+async def bench_giveaway_draw(http, count=100_000, rounds=20):
+    """Ending giveaways with `count` entrants each: cleanup queries and the draw."""
+    recorder = Recorder()
+    with recorder:
+        for _ in range(rounds):
+            cog, message_id = await _giveaway_with_entrants(http, count)
+            cog.active_giveaways[message_id]["entrants"] = dict.fromkeys(range(100, 100 + count), 1)
+            await recorder.time(cog.end_giveaway(message_id))
+    return recorder.result()
+
+
+async def bench_boost_storm(http, guild_count=50, boosts_per_guild=100, noise_per_boost=4):
+    """Member updates across many guilds: boosts mixed with unrelated updates, then the grouped thank-yous."""
+    boosters.BOOST_ANNOUNCE_WINDOW = 0.05
+    guilds = [FakeGuild(GUILD_ID + (i << 22), http, member_count=boosts_per_guild) for i in range(guild_count)]
+    bot = FakeBot(guilds)
+    cog = Boosters(bot)
+    for guild in guilds:
+        await settings.set(guild.id, booster_channel_id=guild.channel.id)
+
+    events = []
+    for guild in guilds:
+        for member in guild.members:
+            after = FakeUser(member.id, http, guild=guild)
+            after.premium_since = discord.utils.utcnow()
+            events.append((member, after))
+            events.extend((member, member) for _ in range(noise_per_boost))
+    random.shuffle(events)
+
+    recorder = Recorder()
+    with recorder:
+        for before, after in events:
+            await recorder.time(cog.on_member_update(before, after))
+        await asyncio.sleep(boosters.BOOST_ANNOUNCE_WINDOW * 2)
+    result = recorder.result()
+    result["announcements"] = sum(guild.channel.sent for guild in guilds)
+    return result
+
+
+async def bench_automod(http, messages=100_000, members=5000, channels=50, words=2000):
+    """Chat through the automod listener: mostly clean messages, some spammers, invites and filtered words."""
+    automod.FLOOD_SLOWMODE_MINUTES = 0
+    guild = FakeGuild(GUILD_ID, http, member_count=members)
+    bot = FakeBot([guild])
+    cog = ModerationCog(bot)
+    await settings.set(guild.id, automod_enabled=True, automod_rules="3:warn 6:kick",
+                       automod_words="\n".join(f"badword{i}" for i in range(words)))
+    rooms = [FakeChannel(guild.id + 1 + i, guild, http) for i in range(channels)]
+    spammers = random.sample(guild.members, members // 100)
+    texts = ["hello everyone, how is it going today?", "did anyone see the patch notes", "lol",
+             "join my server discord.gg/abcdef", f"you are a badword{words // 2}"]
+
+    recorder = Recorder()
+    with recorder:
+        for i in range(messages):
+            author = spammers[i % len(spammers)] if i % 4 == 0 else random.choice(guild.members)
+            text = texts[0] if i % 4 == 0 else random.choices(texts, weights=(60, 30, 8, 1, 1))[0]
+            message = FakeMessage(random.choice(rooms), text, author=author)
+            await recorder.time(cog.on_message(message))
+        await db.infraction_buffer.flush()
+    result = recorder.result()
+    result["strikes_tracked"] = len(cog.automod.strikes)
+    return result
+
+
+async def bench_infraction_lookup(http, rows=10_000, repeats=3):
+    """Paging through a member with `rows` infractions, cold (cache cleared) and warm."""
+    user_id = 424242
+    started = datetime(2020, 1, 1)
+    await db.run_in_pool(
+        db._execute_many,
+        "INSERT INTO infractions (user_id, guild_id, moderator_id, infraction_type, reason, timestamp)"
+        " VALUES (%s, %s, %s, %s, %s, %s)",
+        [(user_id, GUILD_ID, 3, "Warn", f"Reason {i}", started + timedelta(minutes=i)) for i in range(rows)],
+    )
+
+    async def walk():
+        cursor = None
+        while True:
+            _, cursor = await recorder.time(db.get_infractions_page(user_id, GUILD_ID, before=cursor))
+            if cursor is None:
+                return
+
+    results = {}
+    for name, clear in (("cold", True), ("warm", False)):
+        recorder = Recorder()
+        with recorder:
+            for _ in range(repeats):
+                if clear:
+                    db.infraction_cache.clear()
+                await walk()
+            await recorder.time(db.get_infractions(user_id, GUILD_ID))
+        results[name] = recorder.result()
+    return results
+
+
+SCENARIOS = {
+    "ban_burst": bench_ban_burst,
+    "massban": bench_massban,
+    "giveaway_reactions": bench_giveaway_reactions,
+    "giveaway_draw": bench_giveaway_draw,
+    "boost_storm": bench_boost_storm,
+    "automod": bench_automod,
+    "infraction_lookup": bench_infraction_lookup,
+}
+
+
+async def run(names, http_latency):
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name in names:
+            # Fresh tables per scenario
+            db.backend = db.open_backend("sqlite", os.path.join(directory, f"{name}.db"))
+            await db.create_infractions_table()
+            db.infraction_cache.clear()
+            outcome = await SCENARIOS[name](FakeHTTP(http_latency))
+            await db.close()
+            if "ops" in outcome:
+                results[name] = outcome
+            else:
+                for phase, result in outcome.items():
+                    results[f"{name}_{phase}"] = result
+    return results
+
+
+def report(results, baseline=None):
+    header = f"{'scenario':<26}{'ops':>9}{'ops/s':>12}{'p50 ms':>10}{'p99 ms':>10}"
+    print(header + ("  vs baseline (ops/s, p99)" if baseline else ""))
+    for name, result in results.items():
+        line = f"{name:<26}{result['ops']:>9}{result['ops_per_sec']:>12}{result['p50_ms']:>10}{result['p99_ms']:>10}"
+        previous = (baseline or {}).get(name)
+        if previous:
+            line += f"  {_change(result['ops_per_sec'], previous['ops_per_sec'])}, {_change(result['p99_ms'], previous['p99_ms'])}"
+        print(line)
+
+
+def _change(current, previous):
+    if not previous:
+        return "n/a"
+    return f"{(current - previous) / previous:+.0%}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the cogs offline.")
+    parser.add_argument("scenarios", nargs="*", help=f"Scenarios to run (default: all): {', '.join(SCENARIOS)}.")
+    parser.add_argument("--http-latency", type=float, default=0, help="Simulated Discord API latency in ms.")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline file to save to or compare with.")
+    parser.add_argument("--save", action="store_true", help="Store these results as the new baseline.")
+    parser.add_argument("--compare", action="store_true", help="Show the change against the baseline.")
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    logging.basicConfig(level=logging.WARNING)
+    random.seed(0)
+    results = asyncio.run(run(args.scenarios or list(SCENARIOS), args.http_latency / 1000))
+
+    baseline = None
+    if args.compare and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    report(results, baseline)
+
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump({
+                "saved_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "http_latency_ms": args.http_latency,
+                "results": results,
+            }, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,15 +2,63 @@ import discord
 from discord.ext import commands
 from discord import app_commands
 from typing import Optional
+import asyncio
+import os
+import db
+from guild_settings import settings
+from cluster import shard_filter
+from pagination import Paginator
+import logging
+
+log = logging.getLogger(__name__)
+
+BOOSTERS_PAGE_SIZE = 50  # Mentions per embed, well under the 4096-character description limit
+BOOST_ANNOUNCE_WINDOW = float(os.getenv("BOOST_ANNOUNCE_WINDOW", 10))  # Seconds boosts are grouped for
+MESSAGE_LIMIT = 2000
+DEFAULT_MESSAGE = "🎉✨ {user}, thank you for boosting **{server}**! Your support is magical! ✨🎉"
+BOOST_MESSAGE_TYPES = (
+    discord.MessageType.premium_guild_subscription,
+    discord.MessageType.premium_guild_tier_1,
+    discord.MessageType.premium_guild_tier_2,
+    discord.MessageType.premium_guild_tier_3,
+)
 
 class Boosters(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.booster_channel_id = None  # Store the booster channel ID
-        self.boosters = []  # List to store booster data
-        self.custom_message = (
-            "🎉✨ {user}, thank you for boosting **{server}**! Your support is magical! ✨🎉"
-        )
+        self.boosters = {}  # guild_id -> {user_id: "premium" | "manual"}, mirrored in the boosters table
+        self.pending_announcements = {}  # guild_id -> {user_id: mention} waiting for the window to close
+
+    async def cog_load(self):
+        """Loads stored boosters, then reconciles them with Discord once ready."""
+        self.boosters = await db.get_boosters(shard_filter(self.bot))
+        asyncio.get_running_loop().create_task(self.seed_boosters())
+
+    async def seed_boosters(self):
+        """Bulk-scans each guild's premium subscribers and writes only the differences."""
+        await self.bot.wait_until_ready()
+        for guild in self.bot.guilds:
+            stored = self.boosters.setdefault(guild.id, {})
+            premium = {member.id for member in guild.premium_subscribers}
+            added = [user_id for user_id in premium if user_id not in stored]
+            # Manual entries are kept; only boosts that have lapsed are dropped. Without a full member
+            # list (lazy member caching) a missing booster may just be uncached, so nothing is dropped.
+            lapsed = [user_id for user_id, source in stored.items() if source == "premium" and user_id not in premium]
+            if not guild.chunked:
+                lapsed = []
+            for user_id in added:
+                stored[user_id] = "premium"
+            for user_id in lapsed:
+                del stored[user_id]
+            await db.add_boosters(guild.id, [(user_id, "premium") for user_id in added])
+            await db.remove_boosters(guild.id, lapsed)
+        log.info(f"Seeded boosters for {len(self.bot.guilds)} guilds.")
+
+    def get_channel_id(self, guild_id):
+        return settings.get(guild_id, "booster_channel_id")
+
+    def get_message(self, guild_id):
+        return settings.get(guild_id, "booster_message", DEFAULT_MESSAGE)
 
     @commands.group(name='booster', invoke_without_command=True)
     async def booster(self, ctx):
@@ -20,47 +68,60 @@ class Boosters(commands.Cog):
     @booster.command(name='showall')
     async def showall(self, ctx):
         """Shows a list of server boosters."""
-        if not self.boosters:
+        user_ids = list(self.boosters.get(ctx.guild.id, {}))  # Snapshot so pages stay stable
+        if not user_ids:
             await ctx.send("No boosters found.")
             return
-        embed = discord.Embed(
-            title="Server Boosters",
-            description="\n".join([f"✨ {booster}" for booster in self.boosters]),
-            color=0xFFD700  # Gold color for boosting
-        )
-        await ctx.send(embed=embed)
+
+        async def fetch_page(offset):
+            offset = offset or 0
+            page = user_ids[offset:offset + BOOSTERS_PAGE_SIZE]
+            embed = discord.Embed(
+                title=f"Server Boosters ({len(user_ids)})",
+                description="\n".join([f"✨ <@{user_id}>" for user_id in page]),
+                color=0xFFD700  # Gold color for boosting
+            )
+            next_offset = offset + BOOSTERS_PAGE_SIZE
+            return embed, next_offset if next_offset < len(user_ids) else None
+
+        await Paginator(ctx.author.id, fetch_page).start(ctx)
 
     @booster.command(name='set')
     @commands.has_permissions(administrator=True)
     async def set_channel(self, ctx, channel: discord.TextChannel):
         """Sets the channel for booster announcements."""
-        self.booster_channel_id = channel.id
+        await settings.set(ctx.guild.id, booster_channel_id=channel.id)
         await ctx.send(f"Booster announcements will now be sent in {channel.mention}")
 
     @booster.command(name='simulate')
     async def simulate(self, ctx):
         """Simulates a boosting event."""
-        if not self.booster_channel_id:
+        channel_id = self.get_channel_id(ctx.guild.id)
+        if not channel_id:
             await ctx.send("Booster channel is not set. Use `r!booster set channel #channel` first.")
             return
-        channel = self.bot.get_channel(self.booster_channel_id)
+        channel = self.bot.get_channel(channel_id)
         if not channel:
             await ctx.send("Booster channel is invalid. Please set it again.")
             return
-        message = self.custom_message.format(user=ctx.author.mention, server=ctx.guild.name)
+        message = self.get_message(ctx.guild.id).format(user=ctx.author.mention, server=ctx.guild.name)
         await channel.send(message)
 
     @booster.command(name='add')
     async def add(self, ctx, member: discord.Member):
         """Manually adds a user to the booster list."""
-        self.boosters.append(member.mention)
+        boosters = self.boosters.setdefault(ctx.guild.id, {})
+        if member.id not in boosters:
+            boosters[member.id] = "manual"
+            await db.add_boosters(ctx.guild.id, [(member.id, "manual")])
         await ctx.send(f"{member.mention} has been added to the booster list.")
 
     @booster.command(name='remove')
     async def remove(self, ctx, member: discord.Member):
         """Removes a user from the booster list."""
-        if member.mention in self.boosters:
-            self.boosters.remove(member.mention)
+        boosters = self.boosters.get(ctx.guild.id, {})
+        if boosters.pop(member.id, None) is not None:
+            await db.remove_boosters(ctx.guild.id, [member.id])
             await ctx.send(f"{member.mention} has been removed from the booster list.")
         else:
             await ctx.send(f"{member.mention} is not in the booster list.")
@@ -69,28 +130,78 @@ class Boosters(commands.Cog):
     @commands.has_permissions(administrator=True)
     async def clear(self, ctx):
         """Clears the booster list."""
-        self.boosters.clear()
+        self.boosters.pop(ctx.guild.id, None)
+        await db.clear_boosters(ctx.guild.id)
         await ctx.send("Booster list has been cleared.")
 
     @booster.command(name='setmessage')
     @commands.has_permissions(administrator=True)
     async def setmessage(self, ctx, *, message: str):
         """Sets a custom thank-you message for boosting."""
-        self.custom_message = message
+        await settings.set(ctx.guild.id, booster_message=message)
         await ctx.send("Custom thank-you message has been updated.")
 
+    def queue_announcement(self, member):
+        """Adds a new booster to the guild's pending announcement, opening a window on the first one."""
+        pending = self.pending_announcements.setdefault(member.guild.id, {})
+        if not pending:
+            self.bot.loop.create_task(self.flush_announcements(member.guild))
+        pending[member.id] = member.mention
+
+    async def flush_announcements(self, guild):
+        """Sends one combined thank-you for every boost that arrived during the window."""
+        await asyncio.sleep(BOOST_ANNOUNCE_WINDOW)
+        mentions = list(self.pending_announcements.pop(guild.id, {}).values())
+        channel_id = self.get_channel_id(guild.id)
+        channel = self.bot.get_channel(channel_id) if channel_id else None
+        if not channel or not mentions:
+            return
+
+        template = self.get_message(guild.id)
+        budget = MESSAGE_LIMIT - len(template.format(user="", server=guild.name))
+        # Split into as few messages as fit the length limit
+        chunk = []
+        for mention in mentions:
+            if chunk and len(", ".join(chunk + [mention])) > budget:
+                await channel.send(template.format(user=", ".join(chunk), server=guild.name))
+                chunk = []
+            chunk.append(mention)
+        await channel.send(template.format(user=", ".join(chunk), server=guild.name))
+
+    async def record_boost(self, member):
+        boosters = self.boosters.setdefault(member.guild.id, {})
+        if member.id not in boosters:
+            boosters[member.id] = "premium"
+            await db.add_boosters(member.guild.id, [(member.id, "premium")])
+        if self.get_channel_id(member.guild.id):
+            self.queue_announcement(member)  # Keyed by member, so a boost seen twice is thanked once
+
+    @commands.Cog.listener()
+    async def on_message(self, message):
+        """Catches boosts through the guild's boost system message.
+
+        discord.py only reports member updates for cached members, so with lazy member caching this is
+        how boosts by everyone else are seen.
+        """
+        if message.type not in BOOST_MESSAGE_TYPES or not isinstance(message.author, discord.Member):
+            return
+        if self.boosters.get(message.guild.id, {}).get(message.author.id) == "premium":
+            return  # Already recorded, e.g. by on_member_update
+        await self.record_boost(message.author)
+
     @commands.Cog.listener()
     async def on_member_update(self, before, after):
-        """Detects when a user starts boosting and sends a thank-you message."""
+        """Detects when a user starts boosting and queues a thank-you message."""
+        if before.premium_since == after.premium_since:
+            return  # Nickname, role, avatar... updates: nothing to do with boosting
+
         if not before.premium_since and after.premium_since:
-            if self.booster_channel_id:
-                channel = self.bot.get_channel(self.booster_channel_id)
-                if channel:
-                    message = self.custom_message.format(
-                        user=after.mention, server=after.guild.name
-                    )
-                    await channel.send(message)
+            await self.record_boost(after)
+        elif before.premium_since and not after.premium_since:
+            boosters = self.boosters.get(after.guild.id, {})
+            if boosters.get(after.id) == "premium":
+                del boosters[after.id]
+                await db.remove_boosters(after.guild.id, [after.id])
 
 async def setup(bot):
     await bot.add_cog(Boosters(bot))
-    
\ No newline at end of file
@@ -4,57 +4,185 @@ import os
 import asyncio
 from dotenv import load_dotenv
 import logging
-from db import create_infractions_table
-
-# Setup logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='[%(asctime)s] [%(levelname)s]: %(message)s',
-    handlers=[
-        logging.FileHandler("bot.log"),
-        logging.StreamHandler()
-    ]
-)
+import resource
+import signal
+import time
+import db
+import log_config
+import members
+import metrics
+from guild_settings import settings, SettingsError, DEFAULT_PREFIX
+from cluster import shard_filter
 
 # Load environment variables
 load_dotenv()
 TOKEN = os.getenv('DISCORD_TOKEN')
-PREFIX = os.getenv('COMMAND_PREFIX', "r!")  # Command prefix with dynamic configuration
+SHARD_COUNT = os.getenv('SHARD_COUNT')  # Enables sharding; "auto" uses Discord's recommended count
+SHARD_IDS = os.getenv('SHARD_IDS')  # Comma-separated shards for this process, set by cluster.py
+CLUSTER_ID = os.getenv('CLUSTER_ID', "0")
+
+# Setup logging (handlers run on a background thread; clustered processes get their own file)
+log_listener = log_config.setup_logging(CLUSTER_ID if SHARD_IDS else None)
+log = logging.getLogger("bot")
+
+# Extensions loaded at startup. They don't depend on each other, so they load concurrently.
+COGS = ["moderation", "giveaway", "boosters", "donations"]
 
 # Configure intents
 intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True  # Correct attribute for member intents
 
-# Set up the bot
-bot = commands.Bot(command_prefix=PREFIX, intents=intents)
+# Which members stay in memory and whether guilds are chunked at login (see members.py)
+member_options = {
+    "member_cache_flags": members.member_cache_flags(),
+    "chunk_guilds_at_startup": members.CHUNK_GUILDS_AT_STARTUP,
+}
+
+# Set up the bot (command prefixes are per guild, resolved from memory)
+if SHARD_COUNT:
+    bot = commands.AutoShardedBot(
+        command_prefix=settings.get_prefix,
+        intents=intents,
+        shard_count=None if SHARD_COUNT == "auto" else int(SHARD_COUNT),
+        shard_ids=[int(shard_id) for shard_id in SHARD_IDS.split(',')] if SHARD_IDS else None,
+        **member_options,
+    )
+else:
+    bot = commands.Bot(command_prefix=settings.get_prefix, intents=intents, **member_options)
+
+
+async def load_cog(name):
+    """Loads one extension, returning how long it took (None if it failed)."""
+    started = time.perf_counter()
+    try:
+        await bot.load_extension(name)
+    except Exception as e:
+        log.error(f'Failed to load cog {name}: {e}')
+        return None
+    return time.perf_counter() - started
+
+
+async def setup_hook():
+    """Startup pipeline. Runs once before connecting to the gateway, unlike on_ready which fires on every reconnect."""
+    timings = []
+    started = time.perf_counter()
+    metrics.instrument(bot, CLUSTER_ID)
+    members.install(bot)
+
+    # Schema migrations run on a worker thread; everything below needs them applied first
+    await db.create_infractions_table()
+    timings.append(("migrations", time.perf_counter() - started))
+
+    stage = time.perf_counter()
+    await settings.load(shard_filter(bot))
+    timings.append(("guild settings", time.perf_counter() - stage))
+
+    stage = time.perf_counter()
+    cog_times = await asyncio.gather(*(load_cog(name) for name in COGS))
+    timings.append(("cogs", time.perf_counter() - stage))
+
+    total = time.perf_counter() - started
+    report = ", ".join(f"{name} {elapsed * 1000:.0f} ms" for name, elapsed in timings)
+    per_cog = ", ".join(
+        f"{name} {elapsed * 1000:.0f} ms" if elapsed is not None else f"{name} failed"
+        for name, elapsed in zip(COGS, cog_times)
+    )
+    log.info(f'Startup finished in {total * 1000:.0f} ms: {report} ({per_cog})')
+
+bot.setup_hook = setup_hook
 
 
 @bot.event
 async def on_ready():
-    """Event triggered when the bot is ready."""
-    print(f'Logged in as {bot.user.name} ({bot.user.id})')
-    logging.info(f'Bot is ready: {bot.user.name} ({bot.user.id})')
+    """Event triggered when the bot is ready (again after every reconnect)."""
+    log.info(f'Bot is ready: {bot.user.name} ({bot.user.id})')
+
+
+@bot.event
+async def on_shard_ready(shard_id):
+    log.info(f'Cluster {CLUSTER_ID}: shard {shard_id} ready')
+
+
+@bot.event
+async def on_shard_disconnect(shard_id):
+    log.warning(f'Cluster {CLUSTER_ID}: shard {shard_id} disconnected')
+
+
+@bot.event
+async def on_shard_resumed(shard_id):
+    log.info(f'Cluster {CLUSTER_ID}: shard {shard_id} resumed')
+
+
+@bot.event
+async def on_command_error(ctx, error):
+    """Tells the user when a settings change failed to save; other errors get discord.py's default handling."""
+    if isinstance(getattr(error, "original", None), SettingsError):
+        await ctx.send(f"❌ {error.original}")
+        return
+    await commands.Bot.on_command_error(bot, ctx, error)
+
+
+@bot.command(name="shards")
+async def shards(ctx):
+    """Shows the health and websocket latency of each shard this process runs."""
+    if not isinstance(bot, commands.AutoShardedBot):
+        return await ctx.send(f"Not sharded. Latency: {bot.latency * 1000:.0f} ms")
+    lines = []
+    for shard_id, shard in sorted(bot.shards.items()):
+        if shard.is_closed():
+            state = "🔴 disconnected"
+        elif shard.is_ws_ratelimited():
+            state = "🟡 rate limited"
+        else:
+            state = "🟢 connected"
+        guilds = sum(1 for guild in bot.guilds if guild.shard_id == shard_id)
+        lines.append(f"Shard {shard_id}: {state}, {shard.latency * 1000:.0f} ms, {guilds} guilds")
+    here = f" (this server: shard {ctx.guild.shard_id})" if ctx.guild else ""
+    await ctx.send(f"Cluster {CLUSTER_ID} of {bot.shard_count} shards{here}:\n" + "\n".join(lines))
+
+
+@bot.command(name="memory")
+@commands.is_owner()
+async def memory(ctx):
+    """Shows the estimated member cache memory of this process and of its largest guilds."""
+    totals, usage = members.memory_report(bot)
+    lines = [
+        f"{guild.name} (`{guild.id}`): {guild_usage['cached']}/{guild_usage['members']} cached, "
+        f"{guild_usage['looked_up']} looked up, ~{guild_usage['bytes'] / 2**20:.1f} MiB"
+        for guild, guild_usage in usage
+    ]
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10  # KiB on Linux
+    await ctx.send(
+        f"Cluster {CLUSTER_ID}: {totals['guilds']} guilds, {totals['cached']} cached members, "
+        f"{totals['looked_up']} looked up, ~{totals['bytes'] / 2**20:.1f} MiB of members "
+        f"(peak RSS {peak:.0f} MiB).\n" + "\n".join(lines)
+    )
 
-    # Ensure database table exists
-    create_infractions_table()
 
-    # Load cogs
-    for cog in os.listdir('./cogs'):
-        if cog.endswith('.py') and os.path.isfile(f'./cogs/{cog}'):
-            try:
-                await bot.load_extension(f'cogs.{cog[:-3]}')
-                print(f'Loaded cog: {cog}')
-                logging.info(f'Loaded cog: {cog}')
-            except Exception as e:
-                print(f'Failed to load cog {cog}: {e}')
-                logging.error(f'Failed to load cog {cog}: {e}')
+@bot.command(name="setprefix")
+@commands.guild_only()
+@commands.has_permissions(administrator=True)
+async def setprefix(ctx, prefix: str = None):
+    """Sets this server's command prefix, or resets it to the default."""
+    if prefix is not None and len(prefix) > 16:
+        return await ctx.send("The prefix can be at most 16 characters long.")
+    await settings.set(ctx.guild.id, prefix=prefix)
+    await ctx.send(f"Command prefix is now `{prefix or DEFAULT_PREFIX}`.")
 
 
 async def main():
     """Main asynchronous entry point."""
+    # docker stop, systemd and cluster.py stop the bot with SIGTERM; close it like Ctrl-C so the
+    # finally block below still flushes infractions and logs
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGTERM, lambda: loop.create_task(bot.close()))
     async with bot:
-        await bot.start(TOKEN)
+        try:
+            await bot.start(TOKEN)
+        finally:
+            await db.close()  # Flush buffered infractions before exiting
+            log_listener.stop()  # Drain queued log records
 
 
 # Run the bot
@@ -0,0 +1,104 @@
+import itertools
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """A bounded in-memory cache with per-entry expiry and least-recently-used eviction.
+
+    Entries can be tagged with a group so related keys (e.g. every cached page of one member's
+    history) are dropped together by `invalidate_group`. A read that may race a write takes the
+    group's `generation` before it starts and passes it to `set`, which skips the value if the group
+    was invalidated in between.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value, group), oldest use first
+        self._groups = {}  # group -> set of keys
+        self._stamps = itertools.count(1)
+        self._generations = OrderedDict()  # group -> stamp of its last invalidation, oldest first
+        self._generation_floor = 0  # Newest stamp dropped from _generations, the default for other groups
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._remove(key)  # Expired
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value, group=None, generation=None):
+        if generation is not None and generation != self.generation(group):
+            return  # Invalidated while the value was being read, so it may already be stale
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl, value, group)
+        if group is not None:
+            self._groups.setdefault(group, set()).add(key)
+        while len(self._entries) > self.maxsize:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key):
+        _, _, group = self._entries.pop(key)
+        if group is not None:
+            keys = self._groups[group]
+            keys.discard(key)
+            if not keys:
+                del self._groups[group]
+
+    def invalidate(self, key):
+        if key in self._entries:
+            self._remove(key)
+            self.invalidations += 1
+
+    def generation(self, group):
+        """Changes every time `group` is invalidated."""
+        return self._generations.get(group, self._generation_floor)
+
+    def invalidate_group(self, group):
+        for key in self._groups.pop(group, ()):
+            del self._entries[key]
+            self.invalidations += 1
+        self._generations.pop(group, None)
+        self._generations[group] = next(self._stamps)
+        # Only reads in flight need a group's generation, so old ones are dropped. The floor rises
+        # past their stamps, so a read that began before a dropped invalidation still sees a change.
+        while len(self._generations) > self.maxsize:
+            _, stamp = self._generations.popitem(last=False)
+            self._generation_floor = stamp
+
+    def clear(self):
+        self._entries.clear()
+        self._groups.clear()
+        self._generations.clear()
+        self._generation_floor = next(self._stamps)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def group_size(self, group):
+        """Counts the entries tagged with `group` (expired ones included until they are next read)."""
+        return len(self._groups.get(group, ()))
+
+    def stats(self):
+        """Returns the counters used to size the cache."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
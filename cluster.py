@@ -0,0 +1,146 @@
+"""Runs the bot as several worker processes on one host, each owning a contiguous range of shards.
+
+Usage: python cluster.py --clusters 4 [--shards 16]
+
+Without --shards, Discord's recommended shard count is used. Each worker is `bot.py` started with
+SHARD_COUNT, SHARD_IDS and CLUSTER_ID set. Workers share state only through the database, and each
+one only restores giveaways and runs timed actions for guilds on its own shards.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import sys
+import aiohttp
+from dotenv import load_dotenv
+
+log = logging.getLogger(__name__)
+
+GATEWAY_URL = "https://discord.com/api/v10/gateway/bot"
+IDENTIFY_INTERVAL = 5  # Discord allows `max_concurrency` shard identifies per 5 seconds
+RESTART_DELAY = 10  # Seconds before a crashed worker is restarted
+STOP_TIMEOUT = float(os.getenv("CLUSTER_STOP_TIMEOUT", 30))  # Seconds workers get to flush and exit before a kill
+
+
+def shard_filter(bot):
+    """Returns (shard_count, shard_ids) when this process runs a subset of shards, else None."""
+    shard_ids = getattr(bot, "shard_ids", None)
+    if not bot.shard_count or shard_ids is None:
+        return None
+    return bot.shard_count, tuple(shard_ids)
+
+
+def owns_guild(bot, guild_id):
+    """True if the guild's shard is run by this process (always true when not clustered)."""
+    shards = shard_filter(bot)
+    if shards is None:
+        return True
+    shard_count, shard_ids = shards
+    return (guild_id >> 22) % shard_count in shard_ids
+
+
+def shard_ranges(shard_count, clusters):
+    """Splits shard IDs into `clusters` contiguous, near-equal ranges."""
+    size, extra = divmod(shard_count, clusters)
+    ranges, start = [], 0
+    for cluster_id in range(clusters):
+        end = start + size + (1 if cluster_id < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return [shard_ids for shard_ids in ranges if shard_ids]
+
+
+async def fetch_gateway_info(token):
+    """Asks Discord for the recommended shard count and identify concurrency."""
+    async with aiohttp.ClientSession() as session:
+        async with session.get(GATEWAY_URL, headers={"Authorization": f"Bot {token}"}) as response:
+            response.raise_for_status()
+            data = await response.json()
+    return data["shards"], data["session_start_limit"]["max_concurrency"]
+
+
+class Launcher:
+    def __init__(self, shard_count, clusters, max_concurrency=1):
+        self.shard_count = shard_count
+        self.ranges = shard_ranges(shard_count, clusters)
+        self.max_concurrency = max_concurrency
+        self.processes = {}  # cluster_id -> running subprocess
+        self.stopping = False
+        self._shutdown = None
+
+    async def run_worker(self, cluster_id, shard_ids, start_delay):
+        await asyncio.sleep(start_delay)
+        env = {
+            **os.environ,
+            "SHARD_COUNT": str(self.shard_count),
+            "SHARD_IDS": ",".join(map(str, shard_ids)),
+            "CLUSTER_ID": str(cluster_id),
+        }
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.py")
+        while not self.stopping:
+            log.info(f"Starting cluster {cluster_id} with shards {shard_ids[0]}-{shard_ids[-1]}.")
+            process = await asyncio.create_subprocess_exec(sys.executable, script, env=env)
+            self.processes[cluster_id] = process
+            code = await process.wait()
+            del self.processes[cluster_id]
+            if self.stopping or code == 0:
+                return
+            log.warning(f"Cluster {cluster_id} exited with code {code}, restarting in {RESTART_DELAY}s.")
+            await asyncio.sleep(RESTART_DELAY)
+
+    def stop(self):
+        if self.stopping:
+            return
+        self.stopping = True
+        self._shutdown = asyncio.get_running_loop().create_task(self.shutdown())
+
+    async def shutdown(self):
+        """Sends every running worker SIGTERM, and kills the ones still running after STOP_TIMEOUT.
+
+        Workers are signalled even on Ctrl-C, since the launcher may have been signalled alone; one
+        that already got SIGINT from the terminal just closes the bot a second time, which is harmless.
+        """
+        processes = [process for process in self.processes.values() if process.returncode is None]
+        for process in processes:
+            process.send_signal(signal.SIGTERM)
+        try:
+            await asyncio.wait_for(asyncio.gather(*(process.wait() for process in processes)), STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            for process in processes:
+                if process.returncode is None:
+                    log.warning(f"Worker {process.pid} did not exit within {STOP_TIMEOUT:g}s, killing it.")
+                    process.kill()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stop)
+
+        # Stagger startups so clusters don't all identify at once
+        workers, delay = [], 0
+        for cluster_id, shard_ids in enumerate(self.ranges):
+            workers.append(self.run_worker(cluster_id, shard_ids, delay))
+            delay += len(shard_ids) * IDENTIFY_INTERVAL / self.max_concurrency
+        await asyncio.gather(*workers)
+        if self._shutdown is not None:
+            await self._shutdown
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Run the bot as multiple sharded processes.")
+    parser.add_argument("--clusters", type=int, default=os.cpu_count() or 1, help="Worker processes to start.")
+    parser.add_argument("--shards", type=int, default=None, help="Total shards (default: Discord's recommendation).")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] [%(levelname)s]: %(message)s')
+    load_dotenv()
+    shard_count, max_concurrency = await fetch_gateway_info(os.getenv('DISCORD_TOKEN'))
+    shard_count = args.shards or shard_count
+    clusters = max(1, min(args.clusters, shard_count))
+    log.info(f"Launching {shard_count} shards across {clusters} clusters.")
+    await Launcher(shard_count, clusters, max_concurrency).run()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
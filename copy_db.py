@@ -0,0 +1,93 @@
+"""Copies every table from one storage backend to another, e.g. to move a small deployment off MySQL.
+
+Usage: python copy_db.py --from mysql --to sqlite [--sqlite-path bot.db] [--batch 1000]
+
+The target is migrated to the current schema first and must be empty. The source is only read, and
+must already be on the current schema version (start the bot against it once after upgrading).
+Stop the bot while copying so no rows are written behind the copy.
+"""
+import argparse
+import logging
+import sys
+import db
+
+# Parents before children, so a target with foreign keys would accept the rows in order
+TABLES = ("infractions", "infraction_counts", "giveaways", "giveaway_entries", "giveaway_subscriptions",
+          "scheduled_actions", "boosters", "guild_settings")
+
+log = logging.getLogger("copy_db")
+
+
+def schema_version(backend):
+    conn = backend.connect()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+        return cursor.fetchone()[0]
+    finally:
+        conn.close()
+
+
+def copy_table(source, target, table, batch):
+    """Streams one table across in batches of `batch` rows, keeping primary keys. Returns the row count."""
+    src = source.connect()
+    dst = target.connect()
+    try:
+        dst_cursor = dst.cursor()
+        dst_cursor.execute(f"SELECT COUNT(*) FROM {table}")
+        if dst_cursor.fetchone()[0]:
+            raise SystemExit(f"Target table {table} is not empty; refusing to copy into it.")
+
+        cursor = src.cursor()
+        cursor.execute(f"SELECT * FROM {table}")
+        columns = [column[0] for column in cursor.description]
+        insert = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+        copied = 0
+        while True:
+            rows = cursor.fetchmany(batch)
+            if not rows:
+                break
+            dst_cursor.executemany(insert, [tuple(row) for row in rows])
+            dst.commit()
+            copied += len(rows)
+        return copied
+    finally:
+        src.close()
+        dst.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy all bot data between storage backends.")
+    parser.add_argument("--from", dest="source", choices=["mysql", "sqlite"], required=True)
+    parser.add_argument("--to", dest="target", choices=["mysql", "sqlite"], required=True)
+    parser.add_argument("--sqlite-path", default=db.SQLITE_PATH, help="SQLite file used on either side.")
+    parser.add_argument("--batch", type=int, default=1000, help="Rows read and written per round trip.")
+    args = parser.parse_args()
+    if args.source == args.target:
+        parser.error("--from and --to must be different backends.")
+
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] [%(levelname)s]: %(message)s')
+    source = db.open_backend(args.source, args.sqlite_path)
+    target = db.open_backend(args.target, args.sqlite_path)
+    for backend in (source, target):
+        conn = backend.connect()
+        if conn is None:
+            sys.exit(f"Could not connect to the {backend.name} database.")
+        conn.close()
+
+    # db.py's migration code runs against whichever backend is installed
+    db.backend = target
+    db._create_infractions_table()
+    source_version, target_version = schema_version(source), schema_version(target)
+    if source_version != target_version:
+        sys.exit(f"Source is at schema version {source_version} but the target is at {target_version}.")
+
+    for table in TABLES:
+        copied = copy_table(source, target, table, args.batch)
+        log.info(f"Copied {copied} rows from {table}.")
+    source.close()
+    target.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,95 +1,1056 @@
-import mysql.connector
+import asyncio
+import itertools
+from collections import Counter
+from datetime import datetime, timedelta, timezone
 import os
+import re
 from dotenv import load_dotenv
+from cache import TTLCache
+import metrics
+import storage
+import time
+import logging
+
+log = logging.getLogger(__name__)
 
 load_dotenv()  # Load environment variables from .env
 
+DB_BACKEND = os.getenv("DB_BACKEND", "mysql")  # "mysql", or "sqlite" for a local file with no server
+SQLITE_PATH = os.getenv("SQLITE_PATH", "bot.db")
+POOL_NAME = "red_riding_hood"
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))  # Max simultaneous MySQL connections
+RECONNECT_ATTEMPTS = int(os.getenv("DB_RECONNECT_ATTEMPTS", 3))
+RECONNECT_DELAY = int(os.getenv("DB_RECONNECT_DELAY", 1))  # Seconds between reconnect attempts
+INFRACTION_BATCH_SIZE = int(os.getenv("INFRACTION_BATCH_SIZE", 500))  # Rows per multi-row INSERT
+INFRACTION_FLUSH_INTERVAL = float(os.getenv("INFRACTION_FLUSH_INTERVAL", 2))  # Max seconds a row waits in memory
+INFRACTION_FLUSH_RETRIES = 5
+INFRACTIONS_PAGE_SIZE = 10
+INFRACTION_CACHE_SIZE = int(os.getenv("INFRACTION_CACHE_SIZE", 2048))  # Cached lookups, not members
+INFRACTION_CACHE_TTL = float(os.getenv("INFRACTION_CACHE_TTL", 60))
+TOP_MODERATORS = 5
+SUBSCRIBERS_PAGE_SIZE = 500  # Subscribers loaded per round of giveaway notifications
+EXPORT_BATCH_SIZE = 1000  # Rows fetched per round trip when streaming an export
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", 5000))  # Rows archived and deleted per transaction
 
-def get_db_connection():
-    """Establishes and returns a database connection."""
-    try:
-        db = mysql.connector.connect(
+# Versioned schema changes, applied in order on startup. Never edit a released entry; append a new one,
+# to both lists: the same version number must leave the same tables on either backend.
+MIGRATIONS = [
+    (1, [
+        "CREATE INDEX idx_infractions_guild_user_time ON infractions (guild_id, user_id, timestamp)",
+    ]),
+    (2, [
+        """
+        CREATE TABLE IF NOT EXISTS giveaways (
+            message_id BIGINT PRIMARY KEY,
+            guild_id BIGINT NOT NULL,
+            channel_id BIGINT NOT NULL,
+            winners INT NOT NULL,
+            emojis VARCHAR(255) NOT NULL,
+            prize TEXT NOT NULL,
+            ends_at DATETIME NOT NULL,
+            INDEX idx_giveaways_ends_at (ends_at)
+        )
+        """,
+    ]),
+    (3, [
+        """
+        CREATE TABLE IF NOT EXISTS giveaway_entries (
+            message_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            emoji_mask INT NOT NULL,
+            PRIMARY KEY (message_id, user_id)
+        )
+        """,
+    ]),
+    (4, [
+        """
+        CREATE TABLE IF NOT EXISTS scheduled_actions (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            guild_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            action VARCHAR(20) NOT NULL,
+            due_at DATETIME NOT NULL,
+            role_id BIGINT NULL,
+            channel_id BIGINT NULL,
+            INDEX idx_scheduled_actions_due (due_at),
+            INDEX idx_scheduled_actions_target (guild_id, user_id, action)
+        )
+        """,
+    ]),
+    (5, [
+        """
+        CREATE TABLE IF NOT EXISTS boosters (
+            guild_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            source VARCHAR(10) NOT NULL,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (guild_id, user_id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS booster_settings (
+            guild_id BIGINT PRIMARY KEY,
+            channel_id BIGINT NULL,
+            message TEXT NULL
+        )
+        """,
+    ]),
+    (6, [
+        """
+        CREATE TABLE IF NOT EXISTS guild_settings (
+            guild_id BIGINT PRIMARY KEY,
+            prefix VARCHAR(16) NULL,
+            giveaway_channel_id BIGINT NULL,
+            booster_channel_id BIGINT NULL,
+            booster_message TEXT NULL,
+            mute_role_id BIGINT NULL
+        )
+        """,
+        # Booster settings move into the shared table
+        """
+        INSERT INTO guild_settings (guild_id, booster_channel_id, booster_message)
+        SELECT guild_id, channel_id, message FROM booster_settings
+        """,
+        "DROP TABLE booster_settings",
+    ]),
+    (7, [
+        # Daily counts per guild, type and moderator (UTC days), so stats never scan infractions
+        """
+        CREATE TABLE IF NOT EXISTS infraction_counts (
+            guild_id BIGINT NOT NULL,
+            day DATE NOT NULL,
+            infraction_type VARCHAR(50) NOT NULL,
+            moderator_id BIGINT NOT NULL,
+            total INT NOT NULL,
+            PRIMARY KEY (guild_id, day, infraction_type, moderator_id),
+            INDEX idx_infraction_counts_moderator (guild_id, moderator_id, day)
+        )
+        """,
+        # Backfill from the existing rows; from here on _log_infractions keeps the counts current. Days
+        # are UTC like the ones it writes, whatever the server's time zone
+        """
+        INSERT INTO infraction_counts (guild_id, day, infraction_type, moderator_id, total)
+        SELECT guild_id, DATE(CONVERT_TZ(timestamp, @@session.time_zone, '+00:00')), COALESCE(infraction_type, ''),
+               moderator_id, COUNT(*)
+        FROM infractions
+        GROUP BY guild_id, DATE(CONVERT_TZ(timestamp, @@session.time_zone, '+00:00')), COALESCE(infraction_type, ''),
+                 moderator_id
+        """,
+    ]),
+    (8, [
+        """
+        CREATE TABLE IF NOT EXISTS giveaway_subscriptions (
+            guild_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            dms_closed BOOLEAN NOT NULL DEFAULT FALSE,
+            subscribed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (guild_id, user_id)
+        )
+        """,
+        # Highest subscriber user ID notified so far; NULL once every subscriber has been handled
+        "ALTER TABLE giveaways ADD COLUMN notify_cursor BIGINT NULL",
+    ]),
+    (9, [
+        "ALTER TABLE guild_settings ADD COLUMN automod_enabled BOOLEAN NULL",
+        "ALTER TABLE guild_settings ADD COLUMN automod_words TEXT NULL",
+        "ALTER TABLE guild_settings ADD COLUMN automod_rules VARCHAR(255) NULL",
+    ]),
+]
+
+SQLITE_MIGRATIONS = [
+    # The MySQL infractions table predates the migrations list; here it is created by the first one
+    (1, [
+        """
+        CREATE TABLE IF NOT EXISTS infractions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id BIGINT NOT NULL,
+            guild_id BIGINT NOT NULL,
+            moderator_id BIGINT NOT NULL,
+            infraction_type VARCHAR(50),
+            reason TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_infractions_guild_user_time ON infractions (guild_id, user_id, timestamp)",
+    ]),
+    (2, [
+        """
+        CREATE TABLE IF NOT EXISTS giveaways (
+            message_id BIGINT PRIMARY KEY,
+            guild_id BIGINT NOT NULL,
+            channel_id BIGINT NOT NULL,
+            winners INT NOT NULL,
+            emojis VARCHAR(255) NOT NULL,
+            prize TEXT NOT NULL,
+            ends_at DATETIME NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_giveaways_ends_at ON giveaways (ends_at)",
+    ]),
+    (3, [
+        """
+        CREATE TABLE IF NOT EXISTS giveaway_entries (
+            message_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            emoji_mask INT NOT NULL,
+            PRIMARY KEY (message_id, user_id)
+        )
+        """,
+    ]),
+    (4, [
+        """
+        CREATE TABLE IF NOT EXISTS scheduled_actions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            action VARCHAR(20) NOT NULL,
+            due_at DATETIME NOT NULL,
+            role_id BIGINT NULL,
+            channel_id BIGINT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_scheduled_actions_due ON scheduled_actions (due_at)",
+        "CREATE INDEX IF NOT EXISTS idx_scheduled_actions_target ON scheduled_actions (guild_id, user_id, action)",
+    ]),
+    # booster_settings only ever existed on MySQL, between versions 5 and 6
+    (5, [
+        """
+        CREATE TABLE IF NOT EXISTS boosters (
+            guild_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            source VARCHAR(10) NOT NULL,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (guild_id, user_id)
+        )
+        """,
+    ]),
+    (6, [
+        """
+        CREATE TABLE IF NOT EXISTS guild_settings (
+            guild_id BIGINT PRIMARY KEY,
+            prefix VARCHAR(16) NULL,
+            giveaway_channel_id BIGINT NULL,
+            booster_channel_id BIGINT NULL,
+            booster_message TEXT NULL,
+            mute_role_id BIGINT NULL
+        )
+        """,
+    ]),
+    (7, [
+        """
+        CREATE TABLE IF NOT EXISTS infraction_counts (
+            guild_id BIGINT NOT NULL,
+            day DATE NOT NULL,
+            infraction_type VARCHAR(50) NOT NULL,
+            moderator_id BIGINT NOT NULL,
+            total INT NOT NULL,
+            PRIMARY KEY (guild_id, day, infraction_type, moderator_id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_infraction_counts_moderator ON infraction_counts (guild_id, moderator_id, day)",
+        # Backfill from the existing rows; from here on _log_infractions keeps the counts current
+        """
+        INSERT INTO infraction_counts (guild_id, day, infraction_type, moderator_id, total)
+        SELECT guild_id, DATE(timestamp), COALESCE(infraction_type, ''), moderator_id, COUNT(*)
+        FROM infractions
+        GROUP BY guild_id, DATE(timestamp), COALESCE(infraction_type, ''), moderator_id
+        """,
+    ]),
+    (8, [
+        """
+        CREATE TABLE IF NOT EXISTS giveaway_subscriptions (
+            guild_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            dms_closed BOOLEAN NOT NULL DEFAULT 0,
+            subscribed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (guild_id, user_id)
+        )
+        """,
+        "ALTER TABLE giveaways ADD COLUMN notify_cursor BIGINT NULL",
+    ]),
+    (9, [
+        "ALTER TABLE guild_settings ADD COLUMN automod_enabled BOOLEAN NULL",
+        "ALTER TABLE guild_settings ADD COLUMN automod_words TEXT NULL",
+        "ALTER TABLE guild_settings ADD COLUMN automod_rules VARCHAR(255) NULL",
+    ]),
+]
+
+_pool_slots = None  # Semaphore sized to the pool so checkouts never fail with "pool exhausted"
+_pool_in_use = 0
+
+# Read-through cache for infraction lookups, grouped by (guild_id, user_id) so a write drops them all
+infraction_cache = TTLCache(maxsize=INFRACTION_CACHE_SIZE, ttl=INFRACTION_CACHE_TTL)
+
+
+def open_backend(name, sqlite_path=SQLITE_PATH):
+    """Builds the storage backend called `name` from the environment configuration."""
+    if name == "mysql":
+        return storage.MySQLBackend(
+            POOL_NAME, POOL_SIZE, RECONNECT_ATTEMPTS, RECONNECT_DELAY,
             host=os.getenv("DB_HOST"),
             user=os.getenv("DB_USER"),
             password=os.getenv("DB_PASSWORD"),
             database=os.getenv("DB_NAME")
         )
-        print("Database connection successful.")
-        return db
-    except mysql.connector.Error as err:
-        print(f"Database connection error: {err}")
-        return None
+    if name == "sqlite":
+        return storage.SQLiteBackend(sqlite_path)
+    raise ValueError(f"Unknown storage backend: {name}")
+
+
+backend = open_backend(DB_BACKEND)
 
 
-def create_infractions_table():
-    """Creates the infractions table if it doesn't already exist."""
+def get_db_connection():
+    """Checks a connection out of the storage backend (None if the database is unreachable)."""
+    return backend.connect()
+
+
+async def run_in_pool(func, *args):
+    """Runs a blocking database function on a worker thread, bounded by the pool size."""
+    global _pool_slots, _pool_in_use
+    if backend.writer is not None and func in _WRITES:
+        # The backend allows one writer at a time, so writes queue on its writer thread instead
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(backend.writer, func, *args)
+        finally:
+            metrics.DB_QUERY_LATENCY.observe(time.perf_counter() - started, _query_label(func, args))
+    if _pool_slots is None:
+        _pool_slots = asyncio.Semaphore(POOL_SIZE)
+    queued = time.perf_counter()
+    async with _pool_slots:
+        started = time.perf_counter()
+        metrics.DB_POOL_WAIT.observe(started - queued)
+        _pool_in_use += 1
+        try:
+            return await asyncio.to_thread(func, *args)
+        finally:
+            _pool_in_use -= 1
+            metrics.DB_QUERY_LATENCY.observe(time.perf_counter() - started, _query_label(func, args))
+
+
+def _query_label(func, args):
+    """Names a pooled call for metrics: the function, or for the generic helpers the statement and table."""
+    if func in (_execute, _execute_many, _fetch_all) and args:
+        match = re.search(r"^\s*(\w+).*?\b(?:FROM|INTO|UPDATE)\s+(\w+)", args[0], re.IGNORECASE | re.DOTALL)
+        if match:
+            return f"{match.group(1).lower()}_{match.group(2)}"
+    return func.__name__.lstrip("_")
+
+
+def _create_infractions_table():
     db = get_db_connection()
     if db is None:
-        print("Failed to create the table due to a database connection error.")
+        log.warning("Failed to create the table due to a database connection error.")
         return
 
     try:
-        cursor = db.cursor()
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS infractions (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                user_id BIGINT NOT NULL,
-                guild_id BIGINT NOT NULL,
-                moderator_id BIGINT NOT NULL,
-                infraction_type VARCHAR(50),
-                reason TEXT,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        db.commit()
-        print("Infractions table created or already exists.")
-    except mysql.connector.Error as err:
-        print(f"Error creating infractions table: {err}")
+        if backend.name == "mysql":
+            cursor = db.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS infractions (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    user_id BIGINT NOT NULL,
+                    guild_id BIGINT NOT NULL,
+                    moderator_id BIGINT NOT NULL,
+                    infraction_type VARCHAR(50),
+                    reason TEXT,
+                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            db.commit()
+            log.debug("Infractions table created or already exists.")
+        _apply_migrations(db)
+    except backend.Error as err:
+        log.error(f"Error creating infractions table: {err}")
     finally:
-        db.close()
+        db.close()  # Returns the connection to the pool
+
+
+def _apply_migrations(db):
+    """Runs every migration newer than the version recorded in schema_migrations.
 
+    The backend's migration lock keeps processes that start together from migrating at the same time.
+    """
+    with backend.migration_lock(db) as locked:
+        if not locked:
+            log.warning("Timed out waiting for another process to finish migrating.")
+            return
+        _run_migrations(db, db.cursor())
 
-def log_infraction(user_id, guild_id, moderator_id, infraction_type, reason):
-    """Logs an infraction in the database."""
+
+def _run_migrations(db, cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+    current = cursor.fetchone()[0]
+    migrations = SQLITE_MIGRATIONS if backend.name == "sqlite" else MIGRATIONS
+    for version, statements in migrations:
+        if version <= current:
+            continue
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (version,))
+        db.commit()
+        log.info(f"Applied schema migration {version}.")
+
+
+def _log_infractions(records):
+    """Writes (user_id, guild_id, moderator_id, infraction_type, reason) rows in one INSERT, and adds
+    them to the daily counts in the same transaction."""
     db = get_db_connection()
     if db is None:
-        print("Failed to log the infraction due to a database connection error.")
-        return
+        raise backend.connection_error("No database connection available.")
 
     try:
         cursor = db.cursor()
-        cursor.execute("""
+        # executemany() rewrites a plain INSERT ... VALUES into a single multi-row statement
+        cursor.executemany("""
             INSERT INTO infractions (user_id, guild_id, moderator_id, infraction_type, reason)
             VALUES (%s, %s, %s, %s, %s)
-        """, (user_id, guild_id, moderator_id, infraction_type, reason))
+        """, records)
+        # A mass ban collapses into one counter row per moderator and type
+        day = datetime.now(timezone.utc).date()
+        counts = Counter(
+            (guild_id, infraction_type or "", moderator_id)
+            for _, guild_id, moderator_id, infraction_type, _ in records
+        )
+        cursor.executemany(f"""
+            INSERT INTO infraction_counts (guild_id, day, infraction_type, moderator_id, total)
+            VALUES (%s, %s, %s, %s, %s)
+            {backend.upsert(("guild_id", "day", "infraction_type", "moderator_id"), ("total",), add=True)}
+        """, [(guild_id, day, infraction_type, moderator_id, total)
+              for (guild_id, infraction_type, moderator_id), total in counts.items()])
         db.commit()
-        print(f"Infraction logged: {infraction_type} for user {user_id}")
-    except mysql.connector.Error as err:
-        print(f"Error logging infraction: {err}")
+        log.debug(f"Logged {len(records)} infractions.")
     finally:
         db.close()
 
 
-def get_infractions(member_id, guild_id):
-    """Fetches infractions for a specific member in a guild."""
+def is_transient_error(err):
+    """Returns True for errors that are worth retrying (lost connections, deadlocks, a locked file)."""
+    return backend.is_transient(err)
+
+
+class InfractionBuffer:
+    """Queues infraction records in memory and writes them in multi-row INSERT batches.
+
+    A batch is flushed as soon as `max_batch` rows are waiting, or after `flush_interval`
+    seconds otherwise. Call `close()` on shutdown to write whatever is still queued.
+    """
+
+    def __init__(self, max_batch=INFRACTION_BATCH_SIZE, flush_interval=INFRACTION_FLUSH_INTERVAL):
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self._closing = False
+
+    def add(self, record):
+        """Queues one record and makes sure the flusher task is running."""
+        self._pending.append(record)
+        infraction_cache.invalidate_group((record[1], record[0]))
+        if len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._closing = False
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Writes every queued record, one batch of at most `max_batch` rows at a time."""
+        async with self._flush_lock:
+            while self._pending:
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+                await self._write(batch)
+
+    async def _write(self, batch):
+        for attempt in range(1, INFRACTION_FLUSH_RETRIES + 1):
+            try:
+                await run_in_pool(_log_infractions, batch)
+                # Lookups made while the batch was queued may have cached rows without it
+                for user_id, guild_id, *_ in batch:
+                    infraction_cache.invalidate_group((guild_id, user_id))
+                return
+            except backend.Error as err:
+                if not is_transient_error(err) or attempt == INFRACTION_FLUSH_RETRIES:
+                    log.error(f"Error logging {len(batch)} infractions, dropping batch: {err}")
+                    return
+                log.warning(f"Transient error logging infractions (attempt {attempt}), retrying: {err}")
+                await asyncio.sleep(min(2 ** attempt, 30))
+
+    async def close(self):
+        """Stops the flusher task and writes any remaining records."""
+        self._closing = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        await self.flush()
+
+
+infraction_buffer = InfractionBuffer()
+
+metrics.Gauge("bot_db_pool_size", "Configured database connections.", callback=lambda: POOL_SIZE)
+metrics.Gauge("bot_db_pool_in_use", "Database connections currently checked out.", callback=lambda: _pool_in_use)
+metrics.Gauge("bot_infraction_buffer_pending", "Infractions queued and not yet written.",
+              callback=lambda: len(infraction_buffer._pending))
+metrics.Gauge("bot_infraction_cache_entries", "Entries in the infraction lookup cache.", callback=lambda: len(infraction_cache))
+metrics.Counter("bot_infraction_cache_lookups_total", "Infraction cache lookups by result.", ["result"],
+                callback=lambda: {("hit",): infraction_cache.hits, ("miss",): infraction_cache.misses})
+
+
+def _get_infractions(member_id, guild_id):
     db = get_db_connection()
     if db is None:
-        print("Failed to fetch infractions due to a database connection error.")
+        log.warning("Failed to fetch infractions due to a database connection error.")
         return []
 
     try:
         cursor = db.cursor(dictionary=True)  # Use dictionary=True for better readability
         cursor.execute("""
-            SELECT infraction_type, reason, timestamp 
-            FROM infractions 
+            SELECT infraction_type, reason, timestamp
+            FROM infractions
             WHERE user_id = %s AND guild_id = %s
         """, (member_id, guild_id))
         rows = cursor.fetchall()
-        print(f"Fetched {len(rows)} infractions for user {member_id} in guild {guild_id}.")
+        log.debug(f"Fetched {len(rows)} infractions for user {member_id} in guild {guild_id}.")
         return rows
-    except mysql.connector.Error as err:
-        print(f"Error fetching infractions: {err}")
+    except backend.Error as err:
+        log.error(f"Error fetching infractions: {err}")
         return []
     finally:
         db.close()
-      
\ No newline at end of file
+
+
+def _get_infractions_page(member_id, guild_id, before=None, limit=INFRACTIONS_PAGE_SIZE):
+    db = get_db_connection()
+    if db is None:
+        log.warning("Failed to fetch infractions due to a database connection error.")
+        return [], None
+
+    query = """
+        SELECT id, infraction_type, reason, timestamp
+        FROM infractions
+        WHERE guild_id = %s AND user_id = %s
+    """
+    params = [guild_id, member_id]
+    if before is not None:
+        # Keyset condition on (timestamp, id), written out so MySQL can range-scan the index
+        query += " AND (timestamp < %s OR (timestamp = %s AND id < %s))"
+        params += [before[0], before[0], before[1]]
+    query += " ORDER BY timestamp DESC, id DESC LIMIT %s"
+    params.append(limit + 1)  # One extra row tells us whether another page exists
+
+    try:
+        cursor = db.cursor(dictionary=True)
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = (rows[-1]["timestamp"], rows[-1]["id"])
+        return rows, next_cursor
+    except backend.Error as err:
+        log.error(f"Error fetching infractions: {err}")
+        return [], None
+    finally:
+        db.close()
+
+
+def _execute(query, params=()):
+    """Runs a single write statement and commits it. Returns False on error."""
+    db = get_db_connection()
+    if db is None:
+        log.warning("Failed to run query due to a database connection error.")
+        return False
+
+    try:
+        cursor = db.cursor()
+        cursor.execute(query, params)
+        db.commit()
+        return True
+    except backend.Error as err:
+        log.error(f"Error running query: {err}")
+        return False
+    finally:
+        db.close()
+
+
+def _execute_many(query, rows):
+    """Runs a write statement once per row in a single transaction. Returns False on error."""
+    db = get_db_connection()
+    if db is None:
+        log.warning("Failed to run query due to a database connection error.")
+        return False
+
+    try:
+        cursor = db.cursor()
+        cursor.executemany(query, rows)
+        db.commit()
+        return True
+    except backend.Error as err:
+        log.error(f"Error running query: {err}")
+        return False
+    finally:
+        db.close()
+
+
+def _fetch_all(query, params=(), strict=False):
+    """Runs a SELECT and returns its rows as dictionaries (empty on error, or None with `strict`)."""
+    failed = None if strict else []
+    db = get_db_connection()
+    if db is None:
+        log.warning("Failed to run query due to a database connection error.")
+        return failed
+
+    try:
+        cursor = db.cursor(dictionary=True)
+        cursor.execute(query, params)
+        return cursor.fetchall()
+    except backend.Error as err:
+        log.error(f"Error running query: {err}")
+        return failed
+    finally:
+        db.close()
+
+
+def _stream_infractions(guild_id, handle_batch, batch_size=EXPORT_BATCH_SIZE):
+    """Passes every infraction in a guild to `handle_batch(rows)`, `batch_size` rows at a time.
+
+    The cursor is unbuffered, so rows stream from the server as they are fetched instead of the whole
+    result being loaded into memory first. Returns the row count, or None if the export failed.
+    """
+    db = get_db_connection()
+    if db is None:
+        log.warning("Failed to export infractions due to a database connection error.")
+        return None
+
+    try:
+        cursor = db.cursor(dictionary=True, buffered=False)
+        # Index order, so the server can stream without sorting
+        cursor.execute("""
+            SELECT id, user_id, guild_id, moderator_id, infraction_type, reason, timestamp
+            FROM infractions
+            WHERE guild_id = %s
+            ORDER BY user_id, timestamp
+        """, (guild_id,))
+        count = 0
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return count
+            handle_batch(rows)
+            count += len(rows)
+    except backend.Error as err:
+        log.error(f"Error exporting infractions: {err}")
+        return None
+    finally:
+        db.close()
+
+
+def _archive_infractions(cutoff, handle_batch, batch_size=ARCHIVE_BATCH_SIZE):
+    """Moves one batch of infractions older than the naive UTC datetime `cutoff` out of the table.
+
+    Rows are read in id order, which is insertion order, and the batch stops at the first row that is
+    too new, so the scan never reaches rows that stay. `handle_batch(rows)` must have stored the rows
+    durably when it returns; they are deleted right after. Returns how many rows were moved (None on error).
+    """
+    db = get_db_connection()
+    if db is None:
+        log.warning("Failed to archive infractions due to a database connection error.")
+        return None
+
+    try:
+        cursor = db.cursor(dictionary=True)
+        cursor.execute("""
+            SELECT id, user_id, guild_id, moderator_id, infraction_type, reason, timestamp
+            FROM infractions
+            ORDER BY id
+            LIMIT %s
+        """, (batch_size,))
+        rows = cursor.fetchall()
+        old = list(itertools.takewhile(lambda row: row["timestamp"] < cutoff, rows))
+        if old:
+            handle_batch(old)
+            cursor.execute("DELETE FROM infractions WHERE id <= %s", (old[-1]["id"],))
+            db.commit()
+        return len(old)
+    except backend.Error as err:
+        log.error(f"Error archiving infractions: {err}")
+        return None
+    finally:
+        db.close()
+
+
+# Run on the backend's writer thread when it has one
+_WRITES = (_create_infractions_table, _log_infractions, _execute, _execute_many, _archive_infractions)
+
+
+def _shard_clause(shards):
+    """SQL condition limiting rows to guilds on the given (shard_count, shard_ids), or none."""
+    if shards is None:
+        return "", ()
+    shard_count, shard_ids = shards
+    placeholders = ", ".join(["%s"] * len(shard_ids))
+    return f" AND MOD(guild_id >> 22, %s) IN ({placeholders})", (shard_count, *shard_ids)
+
+
+async def create_infractions_table():
+    """Creates the infractions table if it doesn't already exist and applies pending migrations."""
+    await run_in_pool(_create_infractions_table)
+
+
+async def log_infraction(user_id, guild_id, moderator_id, infraction_type, reason):
+    """Queues an infraction to be written with the next batch."""
+    infraction_buffer.add((user_id, guild_id, moderator_id, infraction_type, reason))
+
+
+async def log_infractions(records):
+    """Queues many (user_id, guild_id, moderator_id, infraction_type, reason) rows at once, e.g. for a mass ban."""
+    for record in records:
+        infraction_buffer.add(record)
+
+
+async def get_infractions(member_id, guild_id):
+    """Fetches infractions for a specific member in a guild."""
+    key, group = (guild_id, member_id, "all"), (guild_id, member_id)
+    rows = infraction_cache.get(key)
+    if rows is None:
+        generation = infraction_cache.generation(group)
+        rows = await run_in_pool(_get_infractions, member_id, guild_id)
+        infraction_cache.set(key, rows, group=group, generation=generation)
+    return rows
+
+
+async def get_infractions_page(member_id, guild_id, before=None, limit=INFRACTIONS_PAGE_SIZE):
+    """Fetches one page of a member's infractions, newest first.
+
+    Pass the returned cursor as `before` to get the next page; it is None on the last page.
+    """
+    key, group = (guild_id, member_id, "page", before, limit), (guild_id, member_id)
+    page = infraction_cache.get(key)
+    if page is None:
+        generation = infraction_cache.generation(group)
+        page = await run_in_pool(_get_infractions_page, member_id, guild_id, before, limit)
+        infraction_cache.set(key, page, group=group, generation=generation)
+    return page
+
+
+async def save_giveaway(message_id, guild_id, channel_id, winners, emojis, prize, ends_at, notify_cursor=None):
+    """Stores a running giveaway so it survives restarts. `ends_at` is a UTC datetime.
+
+    Pass `notify_cursor=0` when subscribers still have to be notified about it.
+    """
+    return await run_in_pool(_execute, """
+        REPLACE INTO giveaways (message_id, guild_id, channel_id, winners, emojis, prize, ends_at, notify_cursor)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    """, (message_id, guild_id, channel_id, winners, ",".join(emojis), prize, ends_at.replace(tzinfo=None), notify_cursor))
+
+
+async def delete_giveaway(message_id):
+    """Removes a giveaway and its checkpointed entrants once it has ended or been cancelled."""
+    await run_in_pool(_execute, "DELETE FROM giveaway_entries WHERE message_id = %s", (message_id,))
+    return await run_in_pool(_execute, "DELETE FROM giveaways WHERE message_id = %s", (message_id,))
+
+
+async def get_active_giveaways(shards=None):
+    """Fetches every giveaway that has not ended yet, including overdue ones."""
+    clause, params = _shard_clause(shards)
+    rows = await run_in_pool(_fetch_all, f"""
+        SELECT message_id, guild_id, channel_id, winners, emojis, prize, ends_at, notify_cursor
+        FROM giveaways
+        WHERE 1 = 1{clause}
+    """, params)
+    for row in rows:
+        row["emojis"] = row["emojis"].split(",")
+        row["ends_at"] = row["ends_at"].replace(tzinfo=timezone.utc)
+    return rows
+
+
+async def save_giveaway_entries(message_id, entries):
+    """Checkpoints entrants as (user_id, emoji_mask) pairs. A mask of 0 removes the entrant."""
+    upserts = [(message_id, user_id, mask) for user_id, mask in entries if mask]
+    removals = [(message_id, user_id) for user_id, mask in entries if not mask]
+    ok = True
+    if upserts:
+        ok = await run_in_pool(_execute_many, f"""
+            INSERT INTO giveaway_entries (message_id, user_id, emoji_mask)
+            VALUES (%s, %s, %s)
+            {backend.upsert(("message_id", "user_id"), ("emoji_mask",))}
+        """, upserts)
+    if removals:
+        ok = await run_in_pool(_execute_many, """
+            DELETE FROM giveaway_entries WHERE message_id = %s AND user_id = %s
+        """, removals) and ok
+    return ok
+
+
+async def get_giveaway_entries(shards=None):
+    """Fetches checkpointed entrants for every stored giveaway as {message_id: {user_id: emoji_mask}}."""
+    clause, params = _shard_clause(shards)
+    rows = await run_in_pool(_fetch_all, f"""
+        SELECT e.message_id, e.user_id, e.emoji_mask
+        FROM giveaway_entries e
+        JOIN giveaways g ON g.message_id = e.message_id
+        WHERE 1 = 1{clause}
+    """, params)
+    entries = {}
+    for row in rows:
+        entries.setdefault(row["message_id"], {})[row["user_id"]] = row["emoji_mask"]
+    return entries
+
+
+async def add_giveaway_subscriber(guild_id, user_id):
+    """Subscribes a member to the guild's giveaway DMs (again, if their DMs were found closed)."""
+    return await run_in_pool(_execute, f"""
+        INSERT INTO giveaway_subscriptions (guild_id, user_id, dms_closed) VALUES (%s, %s, %s)
+        {backend.upsert(("guild_id", "user_id"), ("dms_closed",))}
+    """, (guild_id, user_id, False))
+
+
+async def remove_giveaway_subscriber(guild_id, user_id):
+    return await run_in_pool(_execute, "DELETE FROM giveaway_subscriptions WHERE guild_id = %s AND user_id = %s",
+                             (guild_id, user_id))
+
+
+async def is_giveaway_subscriber(guild_id, user_id):
+    rows = await run_in_pool(_fetch_all, """
+        SELECT 1 AS subscribed FROM giveaway_subscriptions WHERE guild_id = %s AND user_id = %s AND dms_closed = %s
+    """, (guild_id, user_id, False))
+    return bool(rows)
+
+
+async def get_giveaway_subscribers(guild_id, after=0, limit=SUBSCRIBERS_PAGE_SIZE):
+    """Returns up to `limit` subscriber IDs greater than `after`, in order, skipping closed DMs.
+
+    Returns None on a database error, so it can't be mistaken for the end of the list.
+    """
+    rows = await run_in_pool(_fetch_all, """
+        SELECT user_id FROM giveaway_subscriptions
+        WHERE guild_id = %s AND user_id > %s AND dms_closed = %s
+        ORDER BY user_id
+        LIMIT %s
+    """, (guild_id, after, False, limit), True)
+    if rows is None:
+        return None
+    return [row["user_id"] for row in rows]
+
+
+async def mark_dms_closed(guild_id, user_ids):
+    """Stops notifying subscribers whose DMs are closed, until they subscribe again."""
+    if not user_ids:
+        return True
+    return await run_in_pool(_execute_many, """
+        UPDATE giveaway_subscriptions SET dms_closed = %s WHERE guild_id = %s AND user_id = %s
+    """, [(True, guild_id, user_id) for user_id in user_ids])
+
+
+async def set_notify_cursor(message_id, cursor):
+    """Records notification progress for a giveaway; None marks it finished."""
+    return await run_in_pool(_execute, "UPDATE giveaways SET notify_cursor = %s WHERE message_id = %s",
+                             (cursor, message_id))
+
+
+async def schedule_action(guild_id, user_id, action, due_at, role_id=None, channel_id=None):
+    """Stores a timed moderation action (e.g. "unmute") to run at the UTC datetime `due_at`."""
+    return await run_in_pool(_execute, """
+        INSERT INTO scheduled_actions (guild_id, user_id, action, due_at, role_id, channel_id)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    """, (guild_id, user_id, action, due_at.replace(tzinfo=None), role_id, channel_id))
+
+
+async def cancel_actions(guild_id, user_id, action):
+    """Drops pending actions of one kind for a member, e.g. when they are muted again."""
+    return await run_in_pool(_execute, """
+        DELETE FROM scheduled_actions WHERE guild_id = %s AND user_id = %s AND action = %s
+    """, (guild_id, user_id, action))
+
+
+async def get_due_actions(now, limit, shards=None):
+    """Fetches up to `limit` actions due at or before `now`, earliest first.
+
+    Pass `shards` as (shard_count, shard_ids) so a clustered process only picks up its own guilds.
+    """
+    clause, params = _shard_clause(shards)
+    return await run_in_pool(_fetch_all, f"""
+        SELECT id, guild_id, user_id, action, due_at, role_id, channel_id
+        FROM scheduled_actions
+        WHERE due_at <= %s{clause}
+        ORDER BY due_at
+        LIMIT %s
+    """, (now.replace(tzinfo=None), *params, limit))
+
+
+async def get_next_action_due(shards=None):
+    """Returns the UTC due time of the earliest pending action, or None."""
+    clause, params = _shard_clause(shards)
+    # ORDER BY/LIMIT rather than MIN() so SQLite still knows the column type and returns a datetime
+    rows = await run_in_pool(_fetch_all, f"""
+        SELECT due_at FROM scheduled_actions WHERE 1 = 1{clause} ORDER BY due_at LIMIT 1
+    """, params)
+    if not rows:
+        return None
+    return rows[0]["due_at"].replace(tzinfo=timezone.utc)
+
+
+async def delete_actions(ids):
+    """Removes actions that have been executed."""
+    if not ids:
+        return True
+    placeholders = ", ".join(["%s"] * len(ids))
+    return await run_in_pool(_execute, f"DELETE FROM scheduled_actions WHERE id IN ({placeholders})", tuple(ids))
+
+
+async def get_boosters(shards=None):
+    """Fetches every guild's booster list as {guild_id: {user_id: source}}."""
+    clause, params = _shard_clause(shards)
+    rows = await run_in_pool(_fetch_all, f"SELECT guild_id, user_id, source FROM boosters WHERE 1 = 1{clause}", params)
+    boosters = {}
+    for row in rows:
+        boosters.setdefault(row["guild_id"], {})[row["user_id"]] = row["source"]
+    return boosters
+
+
+async def add_boosters(guild_id, entries):
+    """Stores (user_id, source) pairs for a guild, where source is "premium" or "manual"."""
+    if not entries:
+        return True
+    return await run_in_pool(_execute_many, f"""
+        INSERT INTO boosters (guild_id, user_id, source) VALUES (%s, %s, %s)
+        {backend.upsert(("guild_id", "user_id"), ("source",))}
+    """, [(guild_id, user_id, source) for user_id, source in entries])
+
+
+async def remove_boosters(guild_id, user_ids):
+    if not user_ids:
+        return True
+    return await run_in_pool(_execute_many, "DELETE FROM boosters WHERE guild_id = %s AND user_id = %s",
+                             [(guild_id, user_id) for user_id in user_ids])
+
+
+async def clear_boosters(guild_id):
+    return await run_in_pool(_execute, "DELETE FROM boosters WHERE guild_id = %s", (guild_id,))
+
+
+async def get_guild_settings(shards=None):
+    """Fetches every guild's settings as {guild_id: {field: value}}."""
+    clause, params = _shard_clause(shards)
+    rows = await run_in_pool(_fetch_all, f"""
+        SELECT guild_id, prefix, giveaway_channel_id, booster_channel_id, booster_message, mute_role_id,
+               automod_enabled, automod_words, automod_rules
+        FROM guild_settings
+        WHERE 1 = 1{clause}
+    """, params)
+    return {row.pop("guild_id"): row for row in rows}
+
+
+async def save_guild_settings(guild_id, values):
+    """Stores a guild's full settings row; `values` maps each column to its value."""
+    return await run_in_pool(_execute, """
+        REPLACE INTO guild_settings (guild_id, prefix, giveaway_channel_id, booster_channel_id, booster_message, mute_role_id,
+                                    automod_enabled, automod_words, automod_rules)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """, (guild_id, values["prefix"], values["giveaway_channel_id"], values["booster_channel_id"],
+          values["booster_message"], values["mute_role_id"], values["automod_enabled"], values["automod_words"],
+          values["automod_rules"]))
+
+
+async def get_modlog(moderator_id, guild_id):
+    """Counts a moderator's actions by type: all time, last 30 days and last 7 days.
+
+    Reads only the daily counts, so it costs the same however many infractions the guild has.
+    Returns [{"infraction_type", "total", "last_30d", "last_7d"}], most frequent type first.
+    """
+    today = datetime.now(timezone.utc).date()
+    rows = await run_in_pool(_fetch_all, """
+        SELECT infraction_type,
+               SUM(total) AS total,
+               SUM(CASE WHEN day >= %s THEN total ELSE 0 END) AS last_30d,
+               SUM(CASE WHEN day >= %s THEN total ELSE 0 END) AS last_7d
+        FROM infraction_counts
+        WHERE guild_id = %s AND moderator_id = %s
+        GROUP BY infraction_type
+    """, (today - timedelta(days=29), today - timedelta(days=6), guild_id, moderator_id))
+    for row in rows:
+        for field in ("total", "last_30d", "last_7d"):
+            row[field] = int(row[field])  # MySQL sums come back as Decimal
+    return sorted(rows, key=lambda row: row["total"], reverse=True)
+
+
+async def get_mod_stats(guild_id, days):
+    """Totals for the last `days` UTC days (today included) from the daily counts.
+
+    Returns {"total", "by_type": {type: count}, "top_moderators": [(moderator_id, count)]}.
+    """
+    since = datetime.now(timezone.utc).date() - timedelta(days=days - 1)
+    rows = await run_in_pool(_fetch_all, """
+        SELECT infraction_type, moderator_id, SUM(total) AS total
+        FROM infraction_counts
+        WHERE guild_id = %s AND day >= %s
+        GROUP BY infraction_type, moderator_id
+    """, (guild_id, since))
+    by_type, by_moderator = Counter(), Counter()
+    for row in rows:
+        by_type[row["infraction_type"]] += int(row["total"])
+        by_moderator[row["moderator_id"]] += int(row["total"])
+    return {
+        "total": sum(by_type.values()),
+        "by_type": dict(by_type.most_common()),
+        "top_moderators": by_moderator.most_common(TOP_MODERATORS),
+    }
+
+
+async def export_infractions(guild_id, handle_batch):
+    """Streams a guild's infractions to `handle_batch(rows)`, called on a worker thread.
+
+    Returns the row count, or None on error.
+    """
+    return await run_in_pool(_stream_infractions, guild_id, handle_batch)
+
+
+async def archive_infractions(cutoff, handle_batch):
+    """Moves infractions older than `cutoff` through `handle_batch(rows)` and out of the table.
+
+    The daily counts keep them, so stats still cover archived history. Each batch is a separate
+    call, so on a backend with a single writer thread other writes run in between.
+    """
+    cutoff = cutoff.replace(tzinfo=None)
+    moved = 0
+    try:
+        while True:
+            batch = await run_in_pool(_archive_infractions, cutoff, handle_batch)
+            if not batch:
+                return moved
+            moved += batch
+            if batch < ARCHIVE_BATCH_SIZE:
+                return moved
+    finally:
+        if moved:
+            infraction_cache.clear()
+
+
+def cache_stats():
+    """Returns hit/miss counters for the infraction lookup cache."""
+    return infraction_cache.stats()
+
+
+async def close():
+    """Flushes buffered writes and closes the backend. Call this before the bot shuts down."""
+    await infraction_buffer.close()
+    await asyncio.to_thread(backend.close)
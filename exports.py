@@ -0,0 +1,153 @@
+"""Infraction exports and archival, written as gzip-compressed JSONL or CSV from a streaming cursor.
+
+Usage:
+    python exports.py export --guild ID [--format jsonl|csv] [--out PATH]
+    python exports.py archive [--days N]
+
+Archival moves infractions older than ARCHIVE_AFTER_DAYS out of the table into one file per month,
+ARCHIVE_DIR/infractions-YYYY-MM.jsonl.gz, appending on later runs.
+"""
+import argparse
+import asyncio
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+from datetime import timedelta
+import discord
+from dotenv import load_dotenv
+import db
+
+load_dotenv()
+
+FORMATS = ("jsonl", "csv")
+COLUMNS = ("id", "user_id", "guild_id", "moderator_id", "infraction_type", "reason", "timestamp")
+EXPORT_DIR = os.getenv("EXPORT_DIR", "exports")
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", 0))  # 0 disables archival
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", 24))  # Hours between archival runs
+
+log = logging.getLogger(__name__)
+
+
+class RowWriter:
+    """Appends rows to a gzip file as JSON lines or CSV (with a header when the file is new)."""
+
+    def __init__(self, path, fmt="jsonl"):
+        self.path = path
+        self.fmt = fmt
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._raw = open(path, "ab")
+        self._gzip = gzip.GzipFile(fileobj=self._raw, mode="ab")
+        self._text = io.TextIOWrapper(self._gzip, encoding="utf-8", newline="")
+        if fmt == "csv":
+            self._csv = csv.writer(self._text)
+            if new:
+                self._csv.writerow(COLUMNS)
+
+    def write(self, rows):
+        if self.fmt == "csv":
+            self._csv.writerows([row[column] for column in COLUMNS] for row in rows)
+        else:
+            for row in rows:
+                self._text.write(json.dumps(row, default=str, ensure_ascii=False) + "\n")
+
+    def sync(self):
+        """Makes everything written so far durable on disk."""
+        self._text.flush()
+        self._gzip.flush()
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+
+    def close(self):
+        self._text.close()  # Closes the gzip member and the file beneath it
+
+
+class MonthlyArchive:
+    """Routes archived rows to one file per month of their timestamp."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.writers = {}
+
+    def write(self, rows):
+        touched = set()
+        for row in rows:
+            month = row["timestamp"].strftime("%Y-%m")
+            writer = self.writers.get(month)
+            if writer is None:
+                path = os.path.join(self.directory, f"infractions-{month}.jsonl.gz")
+                writer = self.writers[month] = RowWriter(path)
+            writer.write([row])
+            touched.add(writer)
+        # The rows are deleted from the table as soon as this returns
+        for writer in touched:
+            writer.sync()
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = {}
+
+
+async def export_guild(guild_id, fmt="jsonl", path=None):
+    """Writes a guild's infractions to a compressed file. Returns (path, row count), count None on failure."""
+    if path is None:
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        stamp = discord.utils.utcnow().strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(EXPORT_DIR, f"infractions-{guild_id}-{stamp}.{fmt}.gz")
+    if os.path.exists(path):
+        os.remove(path)  # An export always starts from an empty file
+
+    writer = RowWriter(path, fmt)
+    try:
+        count = await db.export_infractions(guild_id, writer.write)
+    finally:
+        writer.close()
+    if count is None:
+        os.remove(path)
+    return path, count
+
+
+async def archive_old_infractions(days=ARCHIVE_AFTER_DAYS):
+    """Moves infractions older than `days` days into the monthly archive files. Returns how many moved."""
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    archive = MonthlyArchive(ARCHIVE_DIR)
+    try:
+        moved = await db.archive_infractions(discord.utils.utcnow() - timedelta(days=days), archive.write)
+    finally:
+        archive.close()
+    if moved:
+        log.info(f"Archived {moved} infractions older than {days} days to {ARCHIVE_DIR}.")
+    return moved
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Export or archive infractions.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="Write one guild's infractions to a compressed file.")
+    export.add_argument("--guild", type=int, required=True)
+    export.add_argument("--format", choices=FORMATS, default="jsonl")
+    export.add_argument("--out", default=None, help=f"Output file (default: a new file in {EXPORT_DIR}/).")
+    archive = commands.add_parser("archive", help="Move old infractions into the monthly archive files.")
+    archive.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS or None, required=not ARCHIVE_AFTER_DAYS,
+                         help="Archive rows older than this many days (default: ARCHIVE_AFTER_DAYS).")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] [%(levelname)s]: %(message)s')
+    try:
+        if args.command == "export":
+            path, count = await export_guild(args.guild, args.format, args.out)
+            if count is None:
+                raise SystemExit("Export failed; see the log above.")
+            log.info(f"Exported {count} infractions to {path}.")
+        else:
+            await archive_old_infractions(args.days)
+    finally:
+        await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,50 +1,231 @@
 import re
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 import asyncio
 from datetime import timedelta
 import random  # For selecting random winners
+import db
+from guild_settings import settings
+from cluster import shard_filter
+from scheduler import Scheduler
+from notifications import NotificationDispatcher
+import logging
+
+log = logging.getLogger(__name__)
+
+ENTRY_CHECKPOINT_INTERVAL = 15  # Seconds between writes of changed entrants to the database
 
 class Giveaway(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.active_giveaways = {}
-        self.notifications = {}  # Store users who subscribe to notifications
-        self.guild_giveaway_channel = {}  # Store the giveaway channel for each server
+        self.active_giveaways = {}  # message_id -> details, mirrored in the giveaways table
+        self.scheduler = Scheduler(self.end_due_giveaways, name="giveaway scheduler")
+        self.dirty_entrants = {}  # message_id -> user IDs whose entry changed since the last checkpoint
+        self.entries_lock = asyncio.Lock()  # Keeps a checkpoint write from landing after a giveaway's rows are deleted
+        self.notifier = NotificationDispatcher(bot)
+
+    async def cog_load(self):
+        """Reloads giveaways that were running before a restart and reschedules their end."""
+        # When clustered, only giveaways in guilds on this process's shards are loaded
+        shards = shard_filter(self.bot)
+        entries = await db.get_giveaway_entries(shards)
+        unnotified = {}  # message_id -> cursor, for giveaways whose notifications were interrupted
+        for row in await db.get_active_giveaways(shards):
+            self.active_giveaways[row["message_id"]] = {
+                "guild": row["guild_id"],
+                "channel": row["channel_id"],
+                "ends_at": row["ends_at"],
+                "winners": row["winners"],
+                "emojis": row["emojis"],
+                "prize": row["prize"],
+                # user_id -> bitmask of the configured emojis they reacted with
+                "entrants": entries.get(row["message_id"], {}),
+                "reconciled": False,  # Reactions may have changed while we were offline
+            }
+            # Overdue giveaways have a due time in the past, so they end on the scheduler's first pass
+            self.scheduler.schedule(row["message_id"], row["ends_at"].timestamp())
+            if row["notify_cursor"] is not None:
+                unnotified[row["message_id"]] = row["notify_cursor"]
+        log.info(f"Restored {len(self.active_giveaways)} active giveaways.")
+        self.checkpoint_entrants.start()
+        self.notifier.start()
+        if self.active_giveaways:
+            asyncio.get_running_loop().create_task(self.reconcile_restored())
+        if unnotified:
+            asyncio.get_running_loop().create_task(self.resume_notifications(unnotified))
+
+    async def cog_unload(self):
+        self.scheduler.stop()
+        self.notifier.stop()
+        self.checkpoint_entrants.cancel()
+        await self.checkpoint_entrants()
+
+    @tasks.loop(seconds=ENTRY_CHECKPOINT_INTERVAL)
+    async def checkpoint_entrants(self):
+        """Writes entrants that changed since the last run, so a restart loses at most one interval."""
+        dirty, self.dirty_entrants = self.dirty_entrants, {}
+        for message_id, user_ids in dirty.items():
+            async with self.entries_lock:
+                details = self.active_giveaways.get(message_id)
+                if not details:
+                    continue  # Ended or cancelled since; its rows are already gone
+                entrants = details["entrants"]
+                await db.save_giveaway_entries(message_id, [(user_id, entrants.get(user_id, 0)) for user_id in user_ids])
+
+    async def delete_giveaway(self, message_id):
+        """Deletes a giveaway's rows once it has left `active_giveaways`, after any checkpoint write in flight."""
+        async with self.entries_lock:
+            await db.delete_giveaway(message_id)
+
+    def _mark_dirty(self, message_id, user_id):
+        self.dirty_entrants.setdefault(message_id, set()).add(user_id)
+
+    def _update_entrant(self, message_id, payload, added):
+        """Applies one reaction event to a giveaway's entrants. O(1) per event."""
+        details = self.active_giveaways.get(message_id)
+        if not details or payload.user_id == self.bot.user.id:
+            return
+        try:
+            bit = 1 << details["emojis"].index(str(payload.emoji))
+        except ValueError:
+            return  # Not one of this giveaway's emojis
+
+        entrants = details["entrants"]
+        mask = entrants.get(payload.user_id, 0)
+        mask = mask | bit if added else mask & ~bit
+        if mask:
+            entrants[payload.user_id] = mask
+        else:
+            entrants.pop(payload.user_id, None)
+        if details.get("replay") is not None:
+            details["replay"].append((payload.user_id, bit, added))
+        self._mark_dirty(message_id, payload.user_id)
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_add(self, payload):
+        if payload.message_id in self.active_giveaways:
+            if payload.member is not None and payload.member.bot:
+                return
+            self._update_entrant(payload.message_id, payload, added=True)
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_remove(self, payload):
+        if payload.message_id in self.active_giveaways:
+            self._update_entrant(payload.message_id, payload, added=False)
+
+    async def reconcile_restored(self):
+        """Rescans restored giveaways once the bot is ready, one at a time to stay clear of rate limits."""
+        await self.bot.wait_until_ready()
+        for message_id, details in list(self.active_giveaways.items()):
+            if not details["reconciled"] and message_id in self.active_giveaways:
+                await self.reconcile(message_id, details)
+
+    def reconcile(self, message_id, details):
+        """Returns the (shared) task rebuilding entrants from the message's reactions."""
+        task = details.get("reconcile_task")
+        if task is None:
+            task = details["reconcile_task"] = asyncio.get_running_loop().create_task(
+                self._reconcile_entrants(message_id, details)
+            )
+        return task
+
+    async def _reconcile_entrants(self, message_id, details):
+        """Fallback for reaction events missed while the bot was offline: pages through every
+        configured emoji's reactions and replaces the tracked entrants with what is on the message."""
+        details["replay"] = []  # Live events seen during the scan, re-applied on top of it
+        try:
+            channel = self.bot.get_channel(details["channel"])
+            if not channel:
+                return
+            message = await channel.fetch_message(message_id)
+            entrants = {}
+            for reaction in message.reactions:
+                emoji = str(reaction.emoji)
+                if emoji not in details["emojis"]:
+                    continue
+                bit = 1 << details["emojis"].index(emoji)
+                async for user in reaction.users(limit=None):
+                    if not user.bot:
+                        entrants[user.id] = entrants.get(user.id, 0) | bit
+            for user_id, bit, added in details["replay"]:
+                mask = entrants.get(user_id, 0)
+                mask = mask | bit if added else mask & ~bit
+                if mask:
+                    entrants[user_id] = mask
+                else:
+                    entrants.pop(user_id, None)
+
+            for user_id in set(entrants) | set(details["entrants"]):
+                if entrants.get(user_id) != details["entrants"].get(user_id):
+                    self._mark_dirty(message_id, user_id)
+            details["entrants"] = entrants
+            log.debug(f"Reconciled giveaway {message_id}: {len(entrants)} entrants.")
+        except discord.HTTPException as e:
+            log.warning(f"Error reconciling giveaway {message_id}, using checkpointed entrants: {e}")
+        finally:
+            details["replay"] = None
+            details["reconciled"] = True
+
+    def notification_text(self, message_id, details):
+        guild = self.bot.get_guild(details["guild"])
+        link = f"https://discord.com/channels/{details['guild']}/{details['channel']}/{message_id}"
+        return (
+            f"🎉 A giveaway for **{details['prize']}** just started in **{guild.name if guild else 'a server'}**! "
+            f"Enter here: {link}\nUse `giveaway_notify unsubscribe` there to stop these messages."
+        )
+
+    async def resume_notifications(self, cursors):
+        """Restarts notifications that a restart interrupted, from the last saved subscriber."""
+        await self.bot.wait_until_ready()  # Guild names come from the cache
+        for message_id, cursor in cursors.items():
+            details = self.active_giveaways.get(message_id)
+            if details:
+                self.notifier.notify(message_id, details["guild"], self.notification_text(message_id, details), cursor)
+
+    async def end_due_giveaways(self, message_ids):
+        """Scheduler callback: ends every giveaway that came due together."""
+        await self.bot.wait_until_ready()  # Overdue giveaways fire at startup, before the channel cache fills
+        for message_id in message_ids:
+            try:
+                await self.end_giveaway(message_id)
+            except Exception as e:
+                log.error(f"Error ending giveaway {message_id}: {e}")
 
     @commands.command(name="set_giveaway_channel")
     @commands.has_permissions(administrator=True)
     async def set_giveaway_channel(self, ctx, channel: discord.TextChannel):
         """Sets the channel where giveaways will be posted."""
-        self.guild_giveaway_channel[ctx.guild.id] = channel.id
+        await settings.set(ctx.guild.id, giveaway_channel_id=channel.id)
         await ctx.send(f"Giveaway channel has been set to: {channel.mention}")
 
     @commands.command(name="giveaway_start")
     async def giveaway_start(self, ctx, time: str, winners: int, emoji: str, prize: str, image_url: str = None):
         """Starts a giveaway with the specified parameters."""
+        message = None
         try:
-            print(f"Received input: time={time}, winners={winners}, emoji={emoji}, prize={prize}")
+            log.debug(f"Received input: time={time}, winners={winners}, emoji={emoji}, prize={prize}")
 
             # Parse time
             duration = self.parse_time(time)
             if duration is None:
                 return await ctx.send("Invalid time format. Use `XdXhXm` (e.g., `1d2h30m`).")
 
-            print(f"Parsed duration: {duration} seconds")
+            log.debug(f"Parsed duration: {duration} seconds")
 
             # Validate winners
             if winners < 1:
                 return await ctx.send("There must be at least 1 winner.")
 
             # Allow for multiple emojis separated by commas
-            emojis = emoji.split(',')
+            emojis = [emj.strip() for emj in emoji.split(',')]
             if len(emojis) > winners:
                 return await ctx.send("You can't have more emojis than winners!")
 
             # Get the giveaway channel (either the set channel or the current channel)
             giveaway_channel = ctx.channel
-            if ctx.guild.id in self.guild_giveaway_channel:
-                giveaway_channel = self.bot.get_channel(self.guild_giveaway_channel[ctx.guild.id])
+            giveaway_channel_id = settings.get(ctx.guild.id, "giveaway_channel_id")
+            if giveaway_channel_id:
+                giveaway_channel = self.bot.get_channel(giveaway_channel_id)
                 if not giveaway_channel:
                     return await ctx.send("Invalid giveaway channel. Please ask an admin to set it again.")
 
@@ -67,24 +248,40 @@ class Giveaway(commands.Cog):
             # Send the giveaway message in the selected channel
             message = await giveaway_channel.send(embed=embed)
 
-            # Add multiple reactions
-            for emj in emojis:
-                await message.add_reaction(emj)
-
-            # Store giveaway details
+            # Store giveaway details before adding reactions so no early entrant is missed
+            ends_at = discord.utils.utcnow() + timedelta(seconds=duration)
             self.active_giveaways[message.id] = {
+                "guild": ctx.guild.id,
                 "channel": giveaway_channel.id,
-                "duration": duration,
+                "ends_at": ends_at,
                 "winners": winners,
                 "emojis": emojis,  # Store the emojis list
                 "prize": prize,
+                "entrants": {},
+                "reconciled": True,  # Every reaction on a new message reaches us live
             }
 
-            # Wait for the duration and select winners
-            await asyncio.sleep(duration)
-            await self.end_giveaway(message.id)
+            # Add multiple reactions
+            for emj in emojis:
+                await message.add_reaction(emj)
+
+            await db.save_giveaway(message.id, ctx.guild.id, giveaway_channel.id, winners, emojis, prize, ends_at,
+                                   notify_cursor=0)
+            self.scheduler.schedule(message.id, ends_at.timestamp())
+            details = self.active_giveaways[message.id]
+            self.notifier.notify(message.id, ctx.guild.id, self.notification_text(message.id, details))
         except Exception as e:
-            print(f"Error in giveaway_start: {e}")
+            log.error(f"Error in giveaway_start: {e}")
+            if message is not None:
+                # Undo the half-started giveaway (an invalid emoji makes add_reaction fail, for one)
+                self.active_giveaways.pop(message.id, None)
+                self.scheduler.cancel(message.id)
+                self.notifier.cancel(message.id)
+                await self.delete_giveaway(message.id)
+                try:
+                    await message.delete()
+                except discord.HTTPException:
+                    pass
             await ctx.send("An error occurred while starting the giveaway.")
 
     def parse_time(self, time_str: str):
@@ -100,49 +297,42 @@ class Giveaway(commands.Cog):
 
     async def end_giveaway(self, message_id: int):
         """Ends the giveaway and selects winners."""
-        details = self.active_giveaways.get(message_id)
+        details = self.active_giveaways.pop(message_id, None)
         if not details:
             return
+        self.scheduler.cancel(message_id)
+        self.notifier.cancel(message_id)  # Unsent notifications are pointless now
 
         channel = self.bot.get_channel(details["channel"])
+        if channel and not details["reconciled"]:
+            await self.reconcile(message_id, details)  # Restored giveaway that ended before its rescan ran
+        self.dirty_entrants.pop(message_id, None)
+        await self.delete_giveaway(message_id)
         if not channel:
             return
 
-        message = await channel.fetch_message(message_id)
-        if not message:
-            return
-
-        # Retrieve all users who reacted with the specified emoji
-        reaction = discord.utils.get(message.reactions, emoji=details["emojis"][0])
-        if reaction is None:
-            return await channel.send("No valid reactions found for the giveaway.")
-
-        users = []
-        async for user in reaction.users():
-            if not user.bot:  # Exclude the bot itself
-                users.append(user)
-
-        # Select winners
-        if len(users) < details["winners"]:
+        # Entrants were tracked from reaction events, so the draw needs no REST calls
+        entrants = list(details["entrants"])
+        if len(entrants) < details["winners"]:
             return await channel.send("Not enough participants for the giveaway.")
-        
-        winners = random.sample(users, details["winners"])
-        winner_mentions = ", ".join(winner.mention for winner in winners)
+
+        winners = random.sample(entrants, details["winners"])
+        winner_mentions = ", ".join(f"<@{user_id}>" for user_id in winners)
         await channel.send(f"🎉 Congratulations {winner_mentions}! You won **{details['prize']}**!")
-        del self.active_giveaways[message_id]
 
     @commands.command(name="giveaway_notify")
+    @commands.guild_only()
     async def giveaway_notify(self, ctx, action: str):
-        """Subscribes or unsubscribes users from giveaway notifications."""
+        """Subscribes or unsubscribes you from DMs about new giveaways in this server."""
         if action.lower() == "subscribe":
-            if ctx.author.id not in self.notifications:
-                self.notifications[ctx.author.id] = []
-                await ctx.send(f"You've subscribed to giveaway notifications.")
+            if not await db.is_giveaway_subscriber(ctx.guild.id, ctx.author.id):
+                await db.add_giveaway_subscriber(ctx.guild.id, ctx.author.id)
+                await ctx.send(f"You've subscribed to giveaway notifications. Make sure your DMs are open for this server.")
             else:
                 await ctx.send("You're already subscribed.")
         elif action.lower() == "unsubscribe":
-            if ctx.author.id in self.notifications:
-                del self.notifications[ctx.author.id]
+            if await db.is_giveaway_subscriber(ctx.guild.id, ctx.author.id):
+                await db.remove_giveaway_subscriber(ctx.guild.id, ctx.author.id)
                 await ctx.send(f"You've unsubscribed from giveaway notifications.")
             else:
                 await ctx.send("You're not subscribed.")
@@ -152,21 +342,35 @@ class Giveaway(commands.Cog):
     @commands.command(name="giveaway_list")
     async def giveaway_list(self, ctx):
         """Lists active giveaways."""
-        if not self.active_giveaways:
+        now = discord.utils.utcnow()
+        giveaways = []
+        for msg_id, details in self.active_giveaways.items():
+            if details["guild"] != ctx.guild.id:
+                continue
+            line = (
+                f"Giveaway {msg_id}: Prize - {details['prize']}, "
+                f"Time Remaining - {max(int((details['ends_at'] - now).total_seconds()), 0)} seconds"
+            )
+            state = self.notifier.states.get(msg_id)
+            if state:
+                line += f", Notifications - {state.summary()}"
+            giveaways.append(line)
+        if not giveaways:
             await ctx.send("No active giveaways at the moment.")
             return
 
-        giveaways = "\n".join(
-            [f"Giveaway {msg_id}: Prize - {details['prize']}, Time Remaining - {details['duration']} seconds"
-             for msg_id, details in self.active_giveaways.items()]
-        )
-        await ctx.send(f"Active Giveaways:\n{giveaways}")
+        await ctx.send("Active Giveaways:\n" + "\n".join(giveaways))
 
     @commands.command(name="giveaway_cancel")
     async def giveaway_cancel(self, ctx, message_id: int):
         """Cancels a giveaway."""
-        if message_id in self.active_giveaways:
+        details = self.active_giveaways.get(message_id)
+        if details and details["guild"] == ctx.guild.id:
             del self.active_giveaways[message_id]
+            self.scheduler.cancel(message_id)
+            self.notifier.cancel(message_id)
+            self.dirty_entrants.pop(message_id, None)
+            await self.delete_giveaway(message_id)
             await ctx.send(f"Giveaway with ID {message_id} has been canceled.")
         else:
             await ctx.send(f"Giveaway with ID {message_id} does not exist.")
@@ -0,0 +1,64 @@
+import asyncio
+import os
+from dotenv import load_dotenv
+import db
+import logging
+
+log = logging.getLogger(__name__)
+
+load_dotenv()
+
+DEFAULT_PREFIX = os.getenv('COMMAND_PREFIX', "r!")
+FIELDS = ("prefix", "giveaway_channel_id", "booster_channel_id", "booster_message", "mute_role_id",
+          "automod_enabled", "automod_words", "automod_rules")
+
+
+class SettingsError(Exception):
+    """A settings change could not be saved; the in-memory settings were left as they were."""
+
+
+class GuildSettings:
+    """Per-guild configuration loaded once into memory and written through to the guild_settings table.
+
+    Reads never touch the database, so they are safe on hot paths such as prefix resolution.
+    """
+
+    def __init__(self):
+        self._settings = {}  # guild_id -> {field: value}
+        self._locks = {}  # guild_id -> asyncio.Lock, so a guild's saves commit in the order they were made
+
+    async def load(self, shards=None):
+        """Loads settings, only for guilds on `shards` (shard_count, shard_ids) when clustered."""
+        self._settings = await db.get_guild_settings(shards)
+        log.info(f"Loaded settings for {len(self._settings)} guilds.")
+
+    def get(self, guild_id, field, default=None):
+        value = self._settings.get(guild_id, {}).get(field)
+        return default if value is None else value
+
+    async def set(self, guild_id, **changes):
+        """Updates fields in memory and in the database. Pass None to reset a field to its default.
+
+        Raises SettingsError, with the change rolled back, if the database write fails. Changes to the
+        same guild wait for each other, since each one saves the whole row.
+        """
+        unknown = set(changes) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown guild settings: {', '.join(sorted(unknown))}")
+        lock = self._locks.setdefault(guild_id, asyncio.Lock())
+        async with lock:
+            values = self._settings.setdefault(guild_id, dict.fromkeys(FIELDS))
+            previous = {field: values[field] for field in changes}
+            values.update(changes)
+            if not await db.save_guild_settings(guild_id, values):
+                values.update(previous)
+                raise SettingsError("The settings change could not be saved. Please try again later.")
+
+    def get_prefix(self, bot, message):
+        """`command_prefix` callable: resolves the guild's prefix from memory on every message."""
+        if message.guild is None:
+            return DEFAULT_PREFIX
+        return self.get(message.guild.id, "prefix", DEFAULT_PREFIX)
+
+
+settings = GuildSettings()
@@ -0,0 +1,126 @@
+"""Logging setup: records are queued on the event loop and written by a background listener thread."""
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import shutil
+
+LOG_FILE = os.getenv("LOG_FILE", "bot.log")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_ROTATE = os.getenv("LOG_ROTATE", "size")  # "size" or "time"
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024))
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "midnight")  # Used when LOG_ROTATE is "time"
+LOG_BACKUPS = int(os.getenv("LOG_BACKUPS", 10))
+# Fraction of below-WARNING records kept per logger, e.g. "db=0.1,commands=0.5"
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+
+CONTEXT_FIELDS = ("guild", "channel", "user", "command", "latency", "cluster")
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with any context fields passed through `extra=`."""
+
+    def format(self, record):
+        data = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of DEBUG/INFO records from noisy loggers; warnings and errors always pass."""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates  # logger name prefix -> fraction kept
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        name = record.name
+        while name:
+            rate = self.rates.get(name)
+            if rate is not None:
+                return random.random() < rate
+            name = name.rpartition(".")[0]
+        return True
+
+
+class ClusterFilter(logging.Filter):
+    """Stamps the cluster ID on every record, so merged logs from several processes stay apart."""
+
+    def __init__(self, cluster_id):
+        super().__init__()
+        self.cluster_id = cluster_id
+
+    def filter(self, record):
+        record.cluster = self.cluster_id
+        return True
+
+
+def parse_sample_rates(text):
+    rates = {}
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        name, _, rate = item.partition("=")
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+def _gzip_rotator(source, dest):
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+def _file_handler(path):
+    if LOG_ROTATE == "time":
+        handler = logging.handlers.TimedRotatingFileHandler(path, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUPS, encoding="utf-8")
+    else:
+        handler = logging.handlers.RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding="utf-8")
+    # Rotated files are compressed; this runs on the listener thread, never on the event loop
+    handler.namer = lambda name: name + ".gz"
+    handler.rotator = _gzip_rotator
+    return handler
+
+
+def setup_logging(cluster_id=None):
+    """Routes all logging through a QueueHandler and returns the started QueueListener.
+
+    The file gets JSON lines and the console gets the plain format. Clustered processes write to
+    their own file (bot-<cluster>.log) so rotation never races between processes.
+    """
+    path = LOG_FILE
+    if cluster_id is not None:
+        root, ext = os.path.splitext(LOG_FILE)
+        path = f"{root}-{cluster_id}{ext}"
+
+    file_handler = _file_handler(path)
+    file_handler.setFormatter(JsonFormatter())
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter('[%(asctime)s] [%(levelname)s]: %(message)s'))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(parse_sample_rates(LOG_SAMPLE_RATES)))
+    if cluster_id is not None:
+        queue_handler.addFilter(ClusterFilter(cluster_id))
+
+    root_logger = logging.getLogger()
+    root_logger.handlers[:] = [queue_handler]
+    root_logger.setLevel(LOG_LEVEL)
+
+    listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    return listener
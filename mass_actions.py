@@ -0,0 +1,36 @@
+import asyncio
+import discord
+
+MASS_ACTION_CONCURRENCY = 5  # Requests in flight per mass action
+MASS_ACTION_RETRIES = 3
+BULK_BAN_CHUNK = 200  # Most users Discord accepts in one bulk ban request
+
+
+def is_retryable(error):
+    """Rate limits that outlived discord.py's own retries, and Discord server errors."""
+    return error.status == 429 or error.status >= 500
+
+
+async def run_pool(items, worker, concurrency=MASS_ACTION_CONCURRENCY, retries=MASS_ACTION_RETRIES):
+    """Runs `worker(item)` for every item with at most `concurrency` calls in flight.
+
+    Rate-limited and 5xx calls are retried with exponential backoff. Returns `(succeeded, failed)`:
+    `succeeded` holds `(item, result)` pairs and `failed` holds `(item, error)` pairs.
+    """
+    succeeded, failed = [], []
+    pending = iter(items)  # Shared by the workers, so each item is taken exactly once
+
+    async def consume():
+        for item in pending:
+            for attempt in range(1, retries + 1):
+                try:
+                    succeeded.append((item, await worker(item)))
+                    break
+                except discord.HTTPException as e:
+                    if not is_retryable(e) or attempt == retries:
+                        failed.append((item, e))
+                        break
+                    await asyncio.sleep(2 ** attempt)
+
+    await asyncio.gather(*(consume() for _ in range(concurrency)))
+    return succeeded, failed
@@ -0,0 +1,261 @@
+"""Member caching for large guilds.
+
+By default discord.py keeps every member of every guild in memory and requests them all ("chunks" the
+guild) when it logs in, which takes minutes and gigabytes on 100k-member guilds. MEMBER_CACHE and
+CHUNK_GUILDS_AT_STARTUP trade that for lookups on demand: `lookup` finds members discord.py didn't
+cache with a REST or gateway request and keeps them in a bounded LRU cache. Guilds up to
+CHUNK_SMALL_GUILDS members can still be chunked in the background after login, where a full member
+list is cheap.
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import sys
+import discord
+from dotenv import load_dotenv
+from cache import TTLCache
+import metrics
+import logging
+
+log = logging.getLogger(__name__)
+
+load_dotenv()
+
+MEMBER_CACHE = os.getenv("MEMBER_CACHE", "all")  # "all", "none" or MemberCacheFlags names, e.g. "voice,joined"
+CHUNK_GUILDS_AT_STARTUP = os.getenv("CHUNK_GUILDS_AT_STARTUP", "true").lower() in ("1", "true", "yes")
+CHUNK_SMALL_GUILDS = int(os.getenv("CHUNK_SMALL_GUILDS", 0))  # Without startup chunking, chunk guilds up to this size
+MEMBER_LOOKUP_SIZE = int(os.getenv("MEMBER_LOOKUP_SIZE", 10_000))  # Fetched members kept, across all guilds
+MEMBER_LOOKUP_TTL = int(os.getenv("MEMBER_LOOKUP_TTL", 300))  # Seconds before a fetched member is fetched again
+QUERY_BATCH = 100  # User IDs per gateway member query, Discord's limit
+MEMORY_SAMPLE = 50  # Members measured per guild to estimate its memory use
+MEMORY_REPORT_GUILDS = 10  # Guilds broken out in the memory report and metrics
+MEMORY_REFRESH_INTERVAL = 60  # Seconds between refreshes of the member gauges
+
+MISSING = object()
+# The per-member state worth measuring; the guild and connection state are shared and left out
+MEMBER_FIELDS = ("_roles", "nick", "_avatar", "_banner", "joined_at", "premium_since", "activities",
+                 "_client_status", "_permissions", "timed_out_until")
+USER_FIELDS = ("name", "global_name", "discriminator", "_avatar", "_banner", "_avatar_decoration_data")
+
+
+def member_cache_flags():
+    """Builds discord.py's MemberCacheFlags from MEMBER_CACHE."""
+    value = MEMBER_CACHE.strip().lower()
+    if value == "all":
+        return discord.MemberCacheFlags.all()
+    flags = discord.MemberCacheFlags.none()
+    if value == "none":
+        return flags
+    for name in filter(None, (name.strip() for name in value.split(","))):
+        if name not in discord.MemberCacheFlags.VALID_FLAGS:
+            raise ValueError(f"Unknown member cache flag in MEMBER_CACHE: {name}")
+        setattr(flags, name, True)
+    return flags
+
+
+class MemberLookup:
+    """Resolves members whether or not discord.py cached them.
+
+    Cached members come straight from the guild. Others are fetched once and kept, keyed by
+    (guild_id, user_id) and grouped by guild, in an LRU cache with a TTL; "not a member" answers are
+    cached too. Concurrent lookups of the same member share one request.
+    """
+
+    def __init__(self, maxsize=MEMBER_LOOKUP_SIZE, ttl=MEMBER_LOOKUP_TTL):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)  # (guild_id, user_id) -> Member, or None if not a member
+        self._pending = {}  # (guild_id, user_id) -> fetch task
+
+    async def get(self, guild, user_id):
+        """Returns the guild's member with this ID, or None if they aren't in the guild."""
+        member = guild.get_member(user_id)
+        if member is not None:
+            return member
+        key = (guild.id, user_id)
+        member = self.cache.get(key, MISSING)
+        if member is not MISSING:
+            return member
+        task = self._pending.get(key)
+        if task is None:
+            task = self._pending[key] = asyncio.ensure_future(self._fetch(guild, user_id))
+            task.add_done_callback(lambda _: self._pending.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _fetch(self, guild, user_id):
+        try:
+            member = await guild.fetch_member(user_id)
+        except discord.NotFound:
+            member = None
+        self.cache.set((guild.id, user_id), member, group=guild.id)
+        return member
+
+    async def get_many(self, guild, user_ids):
+        """Resolves many user IDs at once. Returns {user_id: Member} for the ones in the guild.
+
+        IDs that aren't cached are asked for over the gateway, QUERY_BATCH per request, instead of
+        with one REST call each.
+        """
+        found, missing = {}, []
+        for user_id in dict.fromkeys(user_ids):
+            member = guild.get_member(user_id)
+            if member is None:
+                member = self.cache.get((guild.id, user_id), MISSING)
+                if member is MISSING:
+                    missing.append(user_id)
+                    continue
+            if member is not None:
+                found[user_id] = member
+
+        for start in range(0, len(missing), QUERY_BATCH):
+            batch = missing[start:start + QUERY_BATCH]
+            try:
+                fetched = await guild.query_members(user_ids=batch, limit=len(batch), cache=False)
+            except asyncio.TimeoutError:
+                log.warning(f"Member query for {len(batch)} users in guild {guild.id} timed out.")
+                continue
+            by_id = {member.id: member for member in fetched}
+            for user_id in batch:
+                member = by_id.get(user_id)
+                self.cache.set((guild.id, user_id), member, group=guild.id)
+                if member is not None:
+                    found[user_id] = member
+        return found
+
+    def invalidate(self, guild_id, user_id):
+        self.cache.invalidate((guild_id, user_id))
+
+    def invalidate_guild(self, guild_id):
+        self.cache.invalidate_group(guild_id)
+
+
+lookup = MemberLookup()
+
+
+def _sizeof(obj, fields):
+    return sys.getsizeof(obj) + sum(
+        sys.getsizeof(value) for value in (getattr(obj, field, None) for field in fields) if value is not None
+    )
+
+
+def cached_count(guild):
+    # guild.members copies the whole cache into a new list; the dict behind it is counted in O(1)
+    return len(guild._members)
+
+
+def estimate_member_bytes(guild):
+    """Average memory of one cached member (with its user), over a sample of the guild's members."""
+    sample = list(itertools.islice(guild._members.values(), MEMORY_SAMPLE))
+    if not sample:
+        return 0
+    return sum(_sizeof(member, MEMBER_FIELDS) + _sizeof(member._user, USER_FIELDS) for member in sample) // len(sample)
+
+
+def guild_memory(guild):
+    """Member memory for one guild: {"members", "cached", "looked_up", "bytes"}.
+
+    `bytes` is estimated from a sample of the guild's cached members. Members in several guilds are
+    counted in full for each.
+    """
+    cached = cached_count(guild)
+    looked_up = lookup.cache.group_size(guild.id)
+    return {
+        "members": guild.member_count or 0,
+        "cached": cached,
+        "looked_up": looked_up,
+        "bytes": estimate_member_bytes(guild) * (cached + looked_up),
+    }
+
+
+def largest_guilds(bot, top=MEMORY_REPORT_GUILDS):
+    return heapq.nlargest(top, bot.guilds, key=cached_count)
+
+
+def memory_report(bot, top=MEMORY_REPORT_GUILDS):
+    """Returns (totals, [(guild, usage)]) for the process and the `top` guilds caching the most members.
+
+    The totals use the per-member size measured in those guilds rather than sampling every guild.
+    """
+    usage = [(guild, guild_memory(guild)) for guild in largest_guilds(bot, top)]
+    cached = sum(cached_count(guild) for guild in bot.guilds)
+    measured = sum(guild_usage["cached"] + guild_usage["looked_up"] for _, guild_usage in usage)
+    member_bytes = sum(guild_usage["bytes"] for _, guild_usage in usage) // measured if measured else 0
+    totals = {
+        "guilds": len(bot.guilds),
+        "cached": cached,
+        "looked_up": len(lookup.cache),
+        "bytes": member_bytes * (cached + len(lookup.cache)),
+    }
+    return totals, usage
+
+
+class MemberStats:
+    """Member cache figures for the metrics gauges, refreshed in the background rather than per scrape."""
+
+    def __init__(self):
+        self.cached = 0
+        self.largest = {}  # (guild_id,) -> cached members, for the MEMORY_REPORT_GUILDS largest guilds
+
+    def refresh(self, bot):
+        self.cached = sum(cached_count(guild) for guild in bot.guilds)
+        self.largest = {(str(guild.id),): cached_count(guild) for guild in largest_guilds(bot)}
+
+    async def run(self, bot):
+        while True:
+            self.refresh(bot)
+            await asyncio.sleep(MEMORY_REFRESH_INTERVAL)
+
+
+stats = MemberStats()
+
+
+async def chunk_small_guilds(bot, guilds=None):
+    """Chunks guilds of at most CHUNK_SMALL_GUILDS members one at a time, after the bot is ready."""
+    await bot.wait_until_ready()
+    chunked = 0
+    for guild in guilds or list(bot.guilds):
+        if guild.chunked or (guild.member_count or 0) > CHUNK_SMALL_GUILDS:
+            continue
+        try:
+            await guild.chunk()
+            chunked += 1
+        except (asyncio.TimeoutError, discord.ClientException) as e:
+            log.warning(f"Failed to chunk guild {guild.id}: {e}")
+    if chunked:
+        log.info(f"Chunked {chunked} guilds of up to {CHUNK_SMALL_GUILDS} members.")
+
+
+def install(bot):
+    """Keeps the member lookup cache current, starts background chunking when configured and
+    registers the member gauges."""
+    async def on_member_join(member):
+        lookup.invalidate(member.guild.id, member.id)  # Drops a cached "not a member"
+
+    async def on_raw_member_remove(payload):
+        lookup.invalidate(payload.guild_id, payload.user.id)
+
+    async def on_guild_remove(guild):
+        lookup.invalidate_guild(guild.id)
+
+    async def on_guild_join(guild):
+        if CHUNK_SMALL_GUILDS and not CHUNK_GUILDS_AT_STARTUP:
+            await chunk_small_guilds(bot, [guild])
+
+    bot.add_listener(on_member_join, "on_member_join")
+    bot.add_listener(on_raw_member_remove, "on_raw_member_remove")
+    bot.add_listener(on_guild_remove, "on_guild_remove")
+    bot.add_listener(on_guild_join, "on_guild_join")
+
+    if CHUNK_SMALL_GUILDS and not CHUNK_GUILDS_AT_STARTUP:
+        if member_cache_flags().joined:
+            bot.loop.create_task(chunk_small_guilds(bot))
+        else:
+            log.warning("CHUNK_SMALL_GUILDS needs the `joined` member cache flag to keep chunked members; ignoring it.")
+
+    bot.loop.create_task(stats.run(bot))
+    metrics.Gauge("bot_cached_members", "Members held in discord.py's member cache.", callback=lambda: stats.cached)
+    metrics.Gauge("bot_guild_cached_members", f"Cached members in the {MEMORY_REPORT_GUILDS} guilds caching the most.",
+                  ["guild"], callback=lambda: stats.largest)
+    metrics.Gauge("bot_member_lookup_entries", "Fetched members and non-members in the lookup cache.",
+                  callback=lambda: len(lookup.cache))
+    metrics.Counter("bot_member_lookups_total", "Member lookup cache lookups by result.", ["result"],
+                    callback=lambda: {("hit",): lookup.cache.hits, ("miss",): lookup.cache.misses})
@@ -0,0 +1,209 @@
+"""In-process metrics exposed in the Prometheus text format on a local HTTP endpoint."""
+import asyncio
+import logging
+import os
+import time
+from aiohttp import web
+
+log = logging.getLogger(__name__)
+command_log = logging.getLogger("commands")
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9100))  # Cluster N listens on METRICS_PORT + N; 0 disables
+LAG_INTERVAL = 1.0  # Seconds between event-loop lag probes
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_registry = []
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        _registry.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return lines
+
+
+class Counter(Metric):
+    """A total that only goes up. With `callback`, it is read when scraped from a total kept
+    elsewhere, like a callback Gauge."""
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=(), callback=None):
+        super().__init__(name, help_text, labels)
+        self.values = {}  # label values tuple -> count
+        self.callback = callback
+
+    def inc(self, *label_values, amount=1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self):
+        values = self.values
+        if self.callback is not None:
+            values = self.callback()
+            if not isinstance(values, dict):
+                values = {(): values}
+        for label_values, value in values.items():
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {value}"
+
+
+class Gauge(Metric):
+    """A value that goes up and down. With `callback`, it is read when scraped: a number, or a
+    {label values tuple: number} dict for labelled gauges."""
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labels=(), callback=None):
+        super().__init__(name, help_text, labels)
+        self.values = {}
+        self.callback = callback
+
+    def set(self, value, *label_values):
+        self.values[label_values] = value
+
+    def samples(self):
+        values = self.values
+        if self.callback is not None:
+            values = self.callback()
+            if not isinstance(values, dict):
+                values = {(): values}
+        for label_values, value in values.items():
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {value}"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+        self.series = {}  # label values tuple -> [bucket counts..., sum, count]
+
+    def observe(self, value, *label_values):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1  # Stored per bucket; made cumulative when rendered
+                break
+        series[-2] += value
+        series[-1] += 1
+
+    def samples(self):
+        for label_values, series in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _format_labels(self.labels, label_values, 'le="%s"' % bound)
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labels, label_values, 'le="+Inf"')
+            yield f"{self.name}_bucket{labels} {series[-1]}"
+            yield f"{self.name}_sum{_format_labels(self.labels, label_values)} {series[-2]}"
+            yield f"{self.name}_count{_format_labels(self.labels, label_values)} {series[-1]}"
+
+
+def render():
+    """Returns every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+COMMAND_LATENCY = Histogram("bot_command_seconds", "Command run time, from before_invoke to after_invoke.", ["command"])
+COMMAND_ERRORS = Counter("bot_command_errors_total", "Commands that raised an error.", ["command"])
+DB_QUERY_LATENCY = Histogram("bot_db_query_seconds", "Database call time, including the hop to the worker thread.", ["query"])
+DB_POOL_WAIT = Histogram("bot_db_pool_wait_seconds", "Time spent waiting for a free pooled connection.")
+GATEWAY_EVENTS = Counter("bot_gateway_events_total", "Gateway events handled, by event.", ["event"])
+EVENT_LOOP_LAG = Gauge("bot_event_loop_lag_seconds", "How late the last event-loop probe woke up.")
+
+
+def instrument(bot, cluster_id=0):
+    """Wires the bot into the metrics: command hooks, event counters, latency gauges and the HTTP endpoint."""
+    @bot.before_invoke
+    async def start_command_timer(ctx):
+        ctx.metrics_started = time.perf_counter()
+
+    @bot.after_invoke
+    async def stop_command_timer(ctx):
+        name = ctx.command.qualified_name
+        started = getattr(ctx, "metrics_started", None)
+        latency = None
+        if started is not None:
+            latency = time.perf_counter() - started
+            COMMAND_LATENCY.observe(latency, name)
+        if ctx.command_failed:
+            COMMAND_ERRORS.inc(name)
+        command_log.info(
+            f"Ran {name}{' (failed)' if ctx.command_failed else ''}.",
+            extra={
+                "guild": ctx.guild.id if ctx.guild else None,
+                "channel": ctx.channel.id,
+                "user": ctx.author.id,
+                "command": name,
+                "latency": round(latency, 4) if latency is not None else None,
+            },
+        )
+
+    async def count_member_update(before, after):
+        GATEWAY_EVENTS.inc("member_update")
+
+    async def count_reaction_add(payload):
+        GATEWAY_EVENTS.inc("raw_reaction_add")
+
+    async def count_reaction_remove(payload):
+        GATEWAY_EVENTS.inc("raw_reaction_remove")
+
+    async def count_message(message):
+        GATEWAY_EVENTS.inc("message")
+
+    bot.add_listener(count_member_update, "on_member_update")
+    bot.add_listener(count_reaction_add, "on_raw_reaction_add")
+    bot.add_listener(count_reaction_remove, "on_raw_reaction_remove")
+    bot.add_listener(count_message, "on_message")
+
+    def websocket_latency():
+        latencies = getattr(bot, "latencies", None)  # (shard_id, latency) pairs on AutoShardedBot
+        if latencies is None:
+            latencies = [(bot.shard_id or 0, bot.latency)]
+        return {(shard_id,): latency for shard_id, latency in latencies if latency == latency}  # Skip NaN
+
+    Gauge("bot_websocket_latency_seconds", "Gateway heartbeat latency per shard.", ["shard"], callback=websocket_latency)
+    Gauge("bot_guilds", "Guilds cached by this process.", callback=lambda: len(bot.guilds))
+
+    asyncio.get_running_loop().create_task(_probe_loop_lag())
+    if METRICS_PORT:
+        return asyncio.get_running_loop().create_task(_serve(METRICS_HOST, METRICS_PORT + int(cluster_id)))
+
+
+async def _probe_loop_lag():
+    while True:
+        expected = time.perf_counter() + LAG_INTERVAL
+        await asyncio.sleep(LAG_INTERVAL)
+        EVENT_LOOP_LAG.set(max(time.perf_counter() - expected, 0))
+
+
+async def _serve(host, port):
+    async def handle(request):
+        return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    log.info(f'Metrics available at http://{host}:{port}/metrics')
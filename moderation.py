@@ -1,12 +1,294 @@
 import discord
-from discord.ext import commands
-from typing import Optional
+from discord.ext import commands, tasks
+from typing import Optional, Tuple
 import asyncio
+import os
+from datetime import timedelta
+import re
 import db
+from guild_settings import settings
+from cluster import shard_filter
+from pagination import Paginator
+from timed_actions import TimedActionDispatcher
+from mute_role import MuteRoleProvisioner
+from mass_actions import run_pool, BULK_BAN_CHUNK
+import purge as purge_engine
+import exports
+import automod
+import members
+import logging
+
+log = logging.getLogger(__name__)
+
+MODSTATS_MAX_DAYS = 365
+INFRACTION_REASON_LENGTH = 500  # Keeps a full page of infractions under Discord's 6000-character embed limit
+AUTOMOD_NOTICES = {
+    "warn": "⚠️ {member} has been warned by automod. Reason: {reason}",
+    "mute": "🔇 {member} has been muted by automod. Reason: {reason}",
+    "kick": "👢 {member} has been kicked by automod. Reason: {reason}",
+    "ban": "🔨 {member} has been banned by automod. Reason: {reason}",
+}
+
+
+class MassActionFlags(commands.FlagConverter):
+    """Targets for massban/masskick, e.g. `ids: 123 456 joined: 10m name: ^free.*nitro reason: raid`."""
+    ids: Optional[str] = None  # Space or comma separated user IDs
+    joined: Optional[str] = None  # Members who joined within this window, e.g. 30m, 2h, 1d
+    name: Optional[str] = None  # Regex matched against username and display name
+    reason: str = "Mass action (raid response)."
+
+
+class PurgeFlags(commands.FlagConverter):
+    """Filters for purge, e.g. `user: @spammer match: discord\.gg attachments: yes after: 2h`."""
+    user: Optional[discord.User] = None
+    match: Optional[str] = None  # Regex matched against message content
+    attachments: bool = False  # Only messages with attachments
+    bots: bool = False  # Only messages from bots
+    after: Optional[str] = None  # Only messages newer than this window, e.g. 2h
+    before: Optional[str] = None  # Only messages older than this window, e.g. 30m
+    channels: Tuple[discord.TextChannel, ...] = ()  # Defaults to the current channel
+    scan: Optional[int] = None  # Messages to scan per channel when filtering
+
+
+def parse_window(text):
+    """Parses a window like `45s`, `30m`, `2h` or `1d` into a timedelta (None if invalid)."""
+    match = re.fullmatch(r"(\d+)([smhd])", text.strip().lower())
+    if not match:
+        return None
+    unit = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days"}[match.group(2)]
+    return timedelta(**{unit: int(match.group(1))})
+
 
 class ModerationCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.timed_actions = TimedActionDispatcher({"unmute": self.expire_mute}, shards=shard_filter(bot))
+        self.mute_roles = MuteRoleProvisioner()
+        self.exports_running = set()  # Guild IDs with an export in progress
+        self.automod = automod.AutoMod()
+        self.slowed_channels = set()  # Channel IDs under automod's flood slowmode
+
+    async def cog_load(self):
+        self.timed_actions.start()
+        # Archival covers every guild, so when clustered only the process running shard 0 does it
+        shards = shard_filter(self.bot)
+        if exports.ARCHIVE_AFTER_DAYS and (shards is None or 0 in shards[1]):
+            self.archive_infractions.start()
+
+    async def cog_unload(self):
+        self.timed_actions.stop()
+        self.archive_infractions.cancel()
+
+    @tasks.loop(hours=exports.ARCHIVE_INTERVAL)
+    async def archive_infractions(self):
+        """Keeps the infractions table small by moving old rows into compressed monthly files."""
+        try:
+            await exports.archive_old_infractions()
+        except OSError as e:
+            log.error(f"Error archiving infractions: {e}")
+
+    async def expire_mute(self, action):
+        """Scheduled action handler: lifts a timed mute."""
+        await self.bot.wait_until_ready()
+        guild = self.bot.get_guild(action["guild_id"])
+        if guild is None:
+            return
+        role = guild.get_role(action["role_id"])
+        member = await members.lookup.get(guild, action["user_id"])
+        if member is None:
+            return  # Left the guild; the role went with them
+        if role is not None:
+            # A looked-up member may be a stale copy without the role; removing a missing role is a no-op
+            await member.remove_roles(role, reason="Timed mute expired.")
+        channel = guild.get_channel(action["channel_id"]) if action["channel_id"] else None
+        if channel is not None:
+            await channel.send(f"🔊 {member.mention} is now unmuted.")
+
+    def get_mute_role(self, guild):
+        """Returns the guild's configured mute role, falling back to a role named "Muted"."""
+        role = guild.get_role(settings.get(guild.id, "mute_role_id", 0))
+        return role or discord.utils.get(guild.roles, name="Muted")
+
+    async def provision_mute_role(self, ctx, role):
+        """Applies the Muted role's overwrites in the background, reporting progress in one edited message."""
+        status = await ctx.send(f"⚙️ Setting up the {role.name} role across channels...")
+
+        async def progress(done, total):
+            await status.edit(content=f"⚙️ Setting up the {role.name} role: {done}/{total} channels updated.")
+
+        try:
+            applied, skipped, failed = await self.mute_roles.provision(ctx.guild, role, progress)
+        except discord.HTTPException as e:
+            await status.edit(content=f"❌ Failed to set up the {role.name} role. Error: {e}")
+            return
+        summary = f"✅ {role.name} role set up: {applied} channels updated, {skipped} already correct"
+        if failed:
+            summary += f", {failed} failed (check my permissions there)"
+        await status.edit(content=summary + ".")
+
+    @commands.Cog.listener()
+    async def on_guild_channel_create(self, channel):
+        """Keeps new channels muted for the Muted role."""
+        role = self.get_mute_role(channel.guild)
+        if role is None:
+            return
+        try:
+            await self.mute_roles.apply_to_channel(channel, role)
+        except discord.HTTPException as e:
+            log.warning(f"Failed to set Muted overwrite on new channel {channel}: {e}")
+
+    @commands.Cog.listener()
+    async def on_message(self, message):
+        """Automod: checks every guild message for spam, floods, mass mentions, invites and filtered words."""
+        if message.guild is None or message.author.bot or not settings.get(message.guild.id, "automod_enabled"):
+            return
+        reason, flooded = self.automod.check(message)
+        if flooded and message.channel.id not in self.slowed_channels:
+            self.slowed_channels.add(message.channel.id)
+            self.bot.loop.create_task(self.flood_slowmode(message.channel))
+        if reason is None:
+            return
+        permissions = getattr(message.author, "guild_permissions", None)
+        if permissions is None or permissions.manage_messages:
+            return  # Moderators are exempt, and a user who already left can't be acted on
+        await self.enforce_automod(message, reason)
+
+    async def flood_slowmode(self, channel):
+        """Slows a flooded channel down for a few minutes, then restores its previous slowmode."""
+        previous = getattr(channel, "slowmode_delay", 0)
+        try:
+            if previous < automod.FLOOD_SLOWMODE:
+                await channel.edit(slowmode_delay=automod.FLOOD_SLOWMODE, reason="Automod: message flood.")
+                await channel.send(
+                    f"🐢 Slowmode set to {automod.FLOOD_SLOWMODE} seconds for {automod.FLOOD_SLOWMODE_MINUTES} "
+                    f"minutes: this channel is getting too many messages."
+                )
+            await asyncio.sleep(automod.FLOOD_SLOWMODE_MINUTES * 60)
+            if previous < automod.FLOOD_SLOWMODE:
+                await channel.edit(slowmode_delay=previous, reason="Automod: flood slowmode expired.")
+        except discord.HTTPException as e:
+            log.warning(f"Automod failed to change slowmode in channel {channel.id}: {e}")
+        finally:
+            self.slowed_channels.discard(channel.id)
+
+    async def enforce_automod(self, message, reason):
+        """Deletes a message that failed automod, adds a strike and applies the guild's rule for that count."""
+        guild, member = message.guild, message.author
+        try:
+            await message.delete()
+        except discord.NotFound:
+            pass
+        except discord.HTTPException as e:
+            log.warning(f"Automod failed to delete message {message.id} in guild {guild.id}: {e}")
+
+        strikes = self.automod.add_strike(guild.id, member.id)
+        rule = self.automod.rules(guild.id).get(strikes)
+        if rule is None:
+            return
+        action, minutes = rule
+        reason = f"Automod: {reason} ({strikes} strikes)."
+        try:
+            if action == "mute":
+                role = self.get_mute_role(guild)
+                if role is None:
+                    log.warning(f"Automod could not mute {member.id} in guild {guild.id}: no mute role is set up.")
+                    return
+                await member.add_roles(role, reason=reason)
+                if minutes:
+                    await self.timed_actions.schedule(
+                        guild.id, member.id, "unmute", discord.utils.utcnow() + timedelta(minutes=minutes),
+                        role_id=role.id, channel_id=message.channel.id
+                    )
+            elif action == "kick":
+                await member.kick(reason=reason)
+            elif action == "ban":
+                await member.ban(reason=reason, delete_message_days=1)
+        except discord.HTTPException as e:
+            log.warning(f"Automod failed to {action} {member.id} in guild {guild.id}: {e}")
+            return
+        await db.log_infraction(member.id, guild.id, self.bot.user.id, action.capitalize(), reason)
+        try:
+            await message.channel.send(AUTOMOD_NOTICES[action].format(member=member.mention, reason=reason),
+                                       delete_after=30)
+        except discord.HTTPException:
+            pass
+
+    # Automod Commands
+    @commands.group(name="automod", invoke_without_command=True)
+    @commands.guild_only()
+    @commands.has_permissions(manage_guild=True)
+    async def automod_group(self, ctx):
+        """Shows this server's automod settings."""
+        enabled = settings.get(ctx.guild.id, "automod_enabled")
+        embed = discord.Embed(
+            title="Automod",
+            description="✅ Enabled." if enabled else "❌ Disabled. Turn it on with `automod on`.",
+            color=discord.Color.purple()
+        )
+        embed.add_field(name="Escalation", value=automod.format_rules(self.automod.rules(ctx.guild.id)), inline=False)
+        embed.add_field(name="Filtered words", value=str(len(automod.split_words(settings.get(ctx.guild.id, "automod_words")))))
+        embed.add_field(
+            name="Limits",
+            value=f"{automod.SPAM_MESSAGES} messages per {automod.SPAM_WINDOW:g}s\n"
+                  f"{automod.MENTION_LIMIT} mentions per message\n"
+                  f"{automod.INVITE_LIMIT} invites per {automod.INVITE_WINDOW:g}s",
+        )
+        embed.set_footer(text="Subcommands: on, off, addword, removeword, clearwords, rules")
+        await ctx.send(embed=embed)
+
+    @automod_group.command(name="on")
+    async def automod_on(self, ctx):
+        """Turns automod on for this server."""
+        await settings.set(ctx.guild.id, automod_enabled=True)
+        await ctx.send("🛡️ Automod is now on.")
+
+    @automod_group.command(name="off")
+    async def automod_off(self, ctx):
+        """Turns automod off for this server."""
+        await settings.set(ctx.guild.id, automod_enabled=None)
+        await ctx.send("🛡️ Automod is now off.")
+
+    @automod_group.command(name="addword")
+    async def automod_addword(self, ctx, *, words: str):
+        """Adds comma-separated words or phrases to the filter."""
+        current = automod.split_words(settings.get(ctx.guild.id, "automod_words"))
+        known = {word.lower() for word in current}
+        added = [word for word in automod.split_words(words) if word.lower() not in known]
+        await settings.set(ctx.guild.id, automod_words="\n".join(current + added))
+        self.automod.invalidate(ctx.guild.id)
+        await ctx.send(f"✅ Added {len(added)} words to the filter ({len(current) + len(added)} in total).")
+
+    @automod_group.command(name="removeword")
+    async def automod_removeword(self, ctx, *, words: str):
+        """Removes comma-separated words or phrases from the filter."""
+        removing = {word.lower() for word in automod.split_words(words)}
+        current = automod.split_words(settings.get(ctx.guild.id, "automod_words"))
+        kept = [word for word in current if word.lower() not in removing]
+        await settings.set(ctx.guild.id, automod_words="\n".join(kept) or None)
+        self.automod.invalidate(ctx.guild.id)
+        await ctx.send(f"✅ Removed {len(current) - len(kept)} words from the filter ({len(kept)} left).")
+
+    @automod_group.command(name="clearwords")
+    async def automod_clearwords(self, ctx):
+        """Empties the word filter."""
+        await settings.set(ctx.guild.id, automod_words=None)
+        self.automod.invalidate(ctx.guild.id)
+        await ctx.send("✅ The word filter is now empty.")
+
+    @automod_group.command(name="rules")
+    async def automod_rules(self, ctx, *, rules: str):
+        """Sets the escalation rules, e.g. `3:warn 5:mute:10 8:kick`, or `reset` for the defaults."""
+        if rules.strip().lower() == "reset":
+            await settings.set(ctx.guild.id, automod_rules=None)
+        else:
+            try:
+                parsed = automod.parse_rules(rules)
+            except ValueError as e:
+                await ctx.send(f"❌ {e}")
+                return
+            await settings.set(ctx.guild.id, automod_rules=automod.format_rules(parsed) or None)
+        self.automod.invalidate(ctx.guild.id)
+        await ctx.send(f"✅ Escalation rules: {automod.format_rules(self.automod.rules(ctx.guild.id))}")
 
     # Ban Command
     @commands.command(name="ban")
@@ -14,9 +296,121 @@ class ModerationCog(commands.Cog):
     async def ban(self, ctx, member: discord.Member, *, reason: Optional[str] = "No reason provided."):
         """Bans a member and logs the infraction."""
         await member.ban(reason=reason, delete_message_days=7)
-        db.log_infraction(member.id, ctx.guild.id, ctx.author.id, "Ban", reason)
+        await db.log_infraction(member.id, ctx.guild.id, ctx.author.id, "Ban", reason)
         await ctx.send(f"🔨 {member.mention} has been banned. Reason: {reason}")
 
+    async def resolve_mass_targets(self, ctx, flags, members_only):
+        """Turns massban/masskick flags into a target list, dropping anyone the author can't act on.
+
+        Returns (targets, skipped). Explicit IDs are always included, looking up members that aren't
+        cached; `joined` and `name` together select the cached members that match both. Those filters
+        are refused when the member cache doesn't keep joining members, as they would match nobody.
+        """
+        targets = {}
+        if flags.ids:
+            user_ids = [int(raw_id) for raw_id in re.split(r"[\s,]+", flags.ids.strip()) if raw_id.isdigit()]
+            found = await members.lookup.get_many(ctx.guild, user_ids)
+            for user_id in user_ids:
+                member = found.get(user_id)
+                if member is not None or not members_only:
+                    targets[user_id] = member or discord.Object(id=user_id)
+
+        if flags.joined or flags.name:
+            if not members.member_cache_flags().joined:
+                raise commands.BadArgument(
+                    "`joined` and `name` need the member cache, which is off (MEMBER_CACHE has no `joined`). "
+                    "Pass the user IDs instead."
+                )
+            window = parse_window(flags.joined) if flags.joined else None
+            if flags.joined and window is None:
+                raise commands.BadArgument("Invalid `joined` window. Use e.g. `30m`, `2h` or `1d`.")
+            try:
+                pattern = re.compile(flags.name, re.IGNORECASE) if flags.name else None
+            except re.error as e:
+                raise commands.BadArgument(f"Invalid `name` pattern: {e}")
+            joined_after = discord.utils.utcnow() - window if window else None
+            for member in ctx.guild.members:
+                if joined_after and (member.joined_at is None or member.joined_at < joined_after):
+                    continue
+                if pattern and not (pattern.search(member.name) or pattern.search(member.display_name)):
+                    continue
+                targets[member.id] = member
+
+        allowed, skipped = [], 0
+        for target in targets.values():
+            if target.id in (ctx.author.id, self.bot.user.id, ctx.guild.owner_id):
+                skipped += 1
+            elif isinstance(target, discord.Member) and ctx.author != ctx.guild.owner and target.top_role >= ctx.author.top_role:
+                skipped += 1
+            else:
+                allowed.append(target)
+        return allowed, skipped
+
+    async def send_mass_summary(self, status, action, done, failed, skipped):
+        """Replaces the progress message with one summary for the whole mass action."""
+        embed = discord.Embed(title=f"Mass {action} complete", color=discord.Color.red())
+        embed.add_field(name="Succeeded", value=str(len(done)))
+        embed.add_field(name="Failed", value=str(len(failed)))
+        embed.add_field(name="Skipped", value=str(skipped))
+        if failed:
+            sample = "\n".join(f"`{target_id}`: {error}" for target_id, error in failed[:10])
+            embed.add_field(name="First failures", value=sample[:1024], inline=False)
+        await status.edit(content=None, embed=embed)
+
+    # Mass Ban Command
+    @commands.command(name="massban")
+    @commands.has_permissions(ban_members=True)
+    async def massban(self, ctx, *, flags: MassActionFlags):
+        """Bans many users at once by ID list, join window and/or name pattern."""
+        try:
+            targets, skipped = await self.resolve_mass_targets(ctx, flags, members_only=False)
+        except commands.BadArgument as e:
+            await ctx.send(f"❌ {e}")
+            return
+        if not targets:
+            await ctx.send("ℹ️ No users matched those filters.")
+            return
+        status = await ctx.send(f"🔨 Banning {len(targets)} users...")
+
+        # Bulk ban takes up to 200 users per request, so the pool works through chunks
+        chunks = [targets[i:i + BULK_BAN_CHUNK] for i in range(0, len(targets), BULK_BAN_CHUNK)]
+
+        async def ban_chunk(chunk):
+            return await ctx.guild.bulk_ban(chunk, reason=flags.reason, delete_message_seconds=7 * 86400)
+
+        succeeded, errors = await run_pool(chunks, ban_chunk)
+        banned = [user.id for _, result in succeeded for user in result.banned]
+        failed = [(user.id, "Discord refused the ban") for _, result in succeeded for user in result.failed]
+        failed += [(target.id, error) for chunk, error in errors for target in chunk]
+
+        await db.log_infractions([(user_id, ctx.guild.id, ctx.author.id, "Ban", flags.reason) for user_id in banned])
+        await self.send_mass_summary(status, "ban", banned, failed, skipped)
+
+    # Mass Kick Command
+    @commands.command(name="masskick")
+    @commands.has_permissions(kick_members=True)
+    async def masskick(self, ctx, *, flags: MassActionFlags):
+        """Kicks many members at once by ID list, join window and/or name pattern."""
+        try:
+            targets, skipped = await self.resolve_mass_targets(ctx, flags, members_only=True)
+        except commands.BadArgument as e:
+            await ctx.send(f"❌ {e}")
+            return
+        if not targets:
+            await ctx.send("ℹ️ No members matched those filters.")
+            return
+        status = await ctx.send(f"👢 Kicking {len(targets)} members...")
+
+        async def kick(member):
+            await member.kick(reason=flags.reason)
+
+        succeeded, errors = await run_pool(targets, kick)
+        kicked = [member.id for member, _ in succeeded]
+        failed = [(member.id, error) for member, error in errors]
+
+        await db.log_infractions([(user_id, ctx.guild.id, ctx.author.id, "Kick", flags.reason) for user_id in kicked])
+        await self.send_mass_summary(status, "kick", kicked, failed, skipped)
+
     # Unban Command
     @commands.command(name="unban")
     @commands.has_permissions(ban_members=True)
@@ -31,7 +425,7 @@ class ModerationCog(commands.Cog):
     async def kick(self, ctx, member: discord.Member, *, reason: Optional[str] = "No reason provided."):
         """Kicks a member and logs the infraction."""
         await member.kick(reason=reason)
-        db.log_infraction(member.id, ctx.guild.id, ctx.author.id, "Kick", reason)
+        await db.log_infraction(member.id, ctx.guild.id, ctx.author.id, "Kick", reason)
         await ctx.send(f"👢 {member.mention} has been kicked. Reason: {reason}")
 
     # Mute Command
@@ -39,58 +433,176 @@ class ModerationCog(commands.Cog):
     @commands.has_permissions(manage_roles=True)
     async def mute(self, ctx, member: discord.Member, duration: Optional[int] = None, *, reason: Optional[str] = "No reason provided."):
         """Mutes a member for an optional duration and logs the infraction."""
-        mute_role = discord.utils.get(ctx.guild.roles, name="Muted")
+        mute_role = self.get_mute_role(ctx.guild)
         if not mute_role:
             mute_role = await ctx.guild.create_role(name="Muted")
-            for channel in ctx.guild.channels:
-                await channel.set_permissions(mute_role, send_messages=False)
+            await settings.set(ctx.guild.id, mute_role_id=mute_role.id)
+            # Channel overwrites are applied in the background; the mute itself doesn't wait for them
+            self.bot.loop.create_task(self.provision_mute_role(ctx, mute_role))
         await member.add_roles(mute_role, reason=reason)
-        db.log_infraction(member.id, ctx.guild.id, ctx.author.id, "Mute", reason)
+        await db.log_infraction(member.id, ctx.guild.id, ctx.author.id, "Mute", reason)
         if duration:
+            # Stored in the database so the unmute survives restarts
+            await self.timed_actions.schedule(
+                ctx.guild.id, member.id, "unmute", discord.utils.utcnow() + timedelta(minutes=duration),
+                role_id=mute_role.id, channel_id=ctx.channel.id
+            )
             await ctx.send(f"🔇 {member.mention} has been muted for {duration} minutes. Reason: {reason}")
-            await asyncio.sleep(duration * 60)
-            await member.remove_roles(mute_role)
-            await ctx.send(f"🔊 {member.mention} is now unmuted.")
         else:
+            await self.timed_actions.cancel(ctx.guild.id, member.id, "unmute")
             await ctx.send(f"🔇 {member.mention} has been muted indefinitely. Reason: {reason}")
 
+    # Mute Sync Command
+    @commands.command(name="mutesync")
+    @commands.has_permissions(manage_roles=True)
+    async def mutesync(self, ctx):
+        """Re-applies the Muted role's channel overwrites, skipping channels that are already correct."""
+        mute_role = self.get_mute_role(ctx.guild)
+        if not mute_role:
+            await ctx.send("ℹ️ There is no Muted role yet; it is created on the first mute.")
+            return
+        await self.provision_mute_role(ctx, mute_role)
+
+    # Mute Role Command
+    @commands.command(name="muterole")
+    @commands.has_permissions(manage_roles=True)
+    async def muterole(self, ctx, role: discord.Role):
+        """Uses an existing role for mutes instead of the default "Muted" role."""
+        await settings.set(ctx.guild.id, mute_role_id=role.id)
+        await ctx.send(f"🔇 Mutes will now use {role.mention}. Run `mutesync` to apply its channel overwrites.")
+
     # Warn Command
     @commands.command(name="warn")
     @commands.has_permissions(manage_messages=True)
     async def warn(self, ctx, member: discord.Member, *, reason: str):
         """Issues a warning to a user and logs the infraction."""
-        db.log_infraction(member.id, ctx.guild.id, ctx.author.id, "Warn", reason)
+        await db.log_infraction(member.id, ctx.guild.id, ctx.author.id, "Warn", reason)
         await ctx.send(f"⚠️ {member.mention} has been warned. Reason: {reason}")
 
     # Purge Command
     @commands.command(name="purge")
     @commands.has_permissions(manage_messages=True)
-    async def purge(self, ctx, amount: Optional[int] = 10):
-        """Deletes the specified number of messages."""
-        await ctx.channel.purge(limit=amount)
-        await ctx.send(f"🧹 Cleared {amount} messages.", delete_after=5)
+    async def purge(self, ctx, amount: Optional[int] = 10, *, flags: PurgeFlags):
+        """Deletes up to `amount` messages per channel, optionally filtered by user, regex, attachments or age."""
+        channels = flags.channels or [ctx.channel]
+        channels = [channel for channel in channels if channel.permissions_for(ctx.author).manage_messages]
+        if not channels:
+            await ctx.send("❌ You can't manage messages in any of those channels.")
+            return
+
+        try:
+            pattern = re.compile(flags.match, re.IGNORECASE) if flags.match else None
+        except re.error as e:
+            await ctx.send(f"❌ Invalid `match` pattern: {e}")
+            return
+        after_window = parse_window(flags.after) if flags.after else None
+        before_window = parse_window(flags.before) if flags.before else None
+        if (flags.after and after_window is None) or (flags.before and before_window is None):
+            await ctx.send("❌ Invalid time window. Use e.g. `30m`, `2h` or `1d`.")
+            return
+
+        now = discord.utils.utcnow()
+        check = purge_engine.build_check(flags.user, pattern, flags.attachments, flags.bots)
+        filtered = any((flags.user, pattern, flags.attachments, flags.bots))
+        # Without filters every scanned message matches, so scanning `amount` is enough
+        scan_limit = (flags.scan or purge_engine.DEFAULT_SCAN_LIMIT) if filtered else amount
+        # Messages posted after the command (including our own status message) are left alone
+        before = now - before_window if before_window else ctx.message
+        after = now - after_window if after_window else None
+
+        await ctx.message.delete()
+        stats = purge_engine.PurgeStats()
+        status = await ctx.send(f"🧹 Purging {len(channels)} channel(s)...")
+        job = self.bot.loop.create_task(
+            purge_engine.purge_channels(channels, check, amount, stats, scan_limit, before, after)
+        )
+        while not job.done():
+            await asyncio.wait([job], timeout=purge_engine.PROGRESS_INTERVAL)
+            if not job.done():
+                await status.edit(content=f"🧹 Purging... {stats.deleted} deleted, {stats.scanned} scanned.")
+        job.result()
+
+        summary = f"🧹 Cleared {stats.deleted} messages"
+        if len(channels) > 1:
+            summary += f" across {len(channels)} channels"
+        if stats.failed:
+            summary += f" ({stats.failed} could not be deleted)"
+        await status.edit(content=summary + ".", delete_after=5)
 
     # Infractions Command
     @commands.command(name="infractions")
     @commands.has_permissions(manage_messages=True)
     async def infractions(self, ctx, member: discord.Member):
-        """Lists all infractions for a member."""
+        """Lists all infractions for a member, one page at a time."""
+        async def fetch_page(cursor):
+            rows, next_cursor = await db.get_infractions_page(member.id, ctx.guild.id, before=cursor)
+            embed = discord.Embed(title=f"Infractions for {member}", color=discord.Color.orange())
+            for row in rows:
+                embed.add_field(
+                    name=f"Case {row['id']} - {row['infraction_type']} - {row['timestamp'].strftime('%Y-%m-%d %H:%M:%S')}",
+                    value=(row["reason"] or "No reason provided.")[:INFRACTION_REASON_LENGTH],
+                    inline=False
+                )
+            return embed, next_cursor
+
         try:
-            rows = db.get_infractions(member.id, ctx.guild.id)
-            if rows:
-                embed = discord.Embed(title=f"Infractions for {member}", color=discord.Color.orange())
-                for infraction_type, reason, timestamp in rows:
-                    embed.add_field(
-                        name=f"{infraction_type} - {timestamp.strftime('%Y-%m-%d %H:%M:%S')}",
-                        value=reason,
-                        inline=False
-                    )
-                await ctx.send(embed=embed)
-            else:
+            first_page = await fetch_page(None)
+            if not first_page[0].fields:
                 await ctx.send(f"ℹ️ No infractions found for {member.mention}.")
+                return
+            await Paginator(ctx.author.id, fetch_page).start(ctx, first_page)
         except Exception as e:
             await ctx.send(f"❌ Failed to fetch infractions for {member.mention}. Error: {e}")
 
+    # Cache Stats Command
+    @commands.command(name="cachestats")
+    @commands.is_owner()
+    async def cachestats(self, ctx):
+        """Shows hit/miss counters for the infraction lookup cache."""
+        stats = db.cache_stats()
+        await ctx.send(
+            f"📊 Infraction cache: {stats['size']}/{stats['maxsize']} entries, "
+            f"{stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate), "
+            f"{stats['evictions']} evictions, {stats['invalidations']} invalidations."
+        )
+
+    # Export Command
+    @commands.command(name="modexport")
+    @commands.has_permissions(administrator=True)
+    async def modexport(self, ctx, fmt: str = "jsonl"):
+        """Exports every infraction in this server as a compressed JSONL or CSV file."""
+        fmt = fmt.lower()
+        if fmt not in exports.FORMATS:
+            await ctx.send(f"❌ Unknown format. Use one of: {', '.join(exports.FORMATS)}.")
+            return
+        if ctx.guild.id in self.exports_running:
+            await ctx.send("ℹ️ An export for this server is already running.")
+            return
+
+        self.exports_running.add(ctx.guild.id)
+        status = await ctx.send("📦 Exporting infractions...")
+        try:
+            path, count = await exports.export_guild(ctx.guild.id, fmt)
+        finally:
+            self.exports_running.discard(ctx.guild.id)
+        if count is None:
+            await status.edit(content="❌ The export failed. Please try again later.")
+            return
+
+        size = os.path.getsize(path)
+        if size <= ctx.guild.filesize_limit:
+            try:
+                await status.delete()
+                await ctx.send(f"📦 Exported {count} infractions.", file=discord.File(path))
+            finally:
+                os.remove(path)  # Uploaded or not, nothing else will collect it
+        else:
+            # Too big to upload; the bot owner can collect it from the host
+            await status.edit(
+                content=f"📦 Exported {count} infractions, but the file ({size / 1024 ** 2:.1f} MB) is too large "
+                        f"to upload here. It was saved on the bot host as `{os.path.basename(path)}`."
+            )
+
     # Slowmode Command
     @commands.command(name="slowmode")
     @commands.has_permissions(manage_channels=True)
@@ -111,23 +623,52 @@ class ModerationCog(commands.Cog):
     @commands.command(name="modlog")
     @commands.has_permissions(manage_messages=True)
     async def modlog(self, ctx, member: discord.Member):
-        """Shows the moderation log for a member."""
+        """Shows how many actions of each type a moderator has taken."""
         try:
-            rows = db.get_modlog(member.id, ctx.guild.id)
+            rows = await db.get_modlog(member.id, ctx.guild.id)
             if rows:
                 embed = discord.Embed(title=f"Moderation Log for {member}", color=discord.Color.purple())
-                for infraction_id, infraction_type, reason, timestamp in rows:
+                for row in rows:
                     embed.add_field(
-                        name=f"Case {infraction_id} - {infraction_type}",
-                        value=f"Reason: {reason}\nDate: {timestamp.strftime('%Y-%m-%d %H:%M:%S')}",
-                        inline=False
+                        name=row["infraction_type"] or "Other",
+                        value=f"7 days: {row['last_7d']}\n30 days: {row['last_30d']}\nAll time: {row['total']}",
                     )
                 await ctx.send(embed=embed)
             else:
-                await ctx.send(f"ℹ️ No moderation history found for {member.mention}.")
+                await ctx.send(f"ℹ️ No moderation actions found for {member.mention}.")
         except Exception as e:
             await ctx.send(f"❌ Failed to fetch modlog for {member.mention}. Error: {e}")
 
+    # Mod Stats Command
+    @commands.command(name="modstats")
+    @commands.has_permissions(manage_messages=True)
+    async def modstats(self, ctx, days: int = 7):
+        """Shows this server's moderation totals and most active moderators over the last `days` days."""
+        days = max(1, min(days, MODSTATS_MAX_DAYS))
+        try:
+            stats = await db.get_mod_stats(ctx.guild.id, days)
+        except Exception as e:
+            await ctx.send(f"❌ Failed to fetch moderation stats. Error: {e}")
+            return
+        if not stats["total"]:
+            await ctx.send(f"ℹ️ No moderation actions in the last {days} days.")
+            return
+
+        embed = discord.Embed(
+            title=f"Moderation stats: last {days} days",
+            description=f"**{stats['total']}** actions in total.",
+            color=discord.Color.purple()
+        )
+        embed.add_field(
+            name="By type",
+            value="\n".join(f"{infraction_type or 'Other'}: {count}" for infraction_type, count in stats["by_type"].items())[:1024],
+        )
+        embed.add_field(
+            name="Top moderators",
+            value="\n".join(f"<@{moderator_id}>: {count}" for moderator_id, count in stats["top_moderators"]),
+        )
+        await ctx.send(embed=embed)
+
     # Lock Command
     @commands.command(name="lock")
     @commands.has_permissions(manage_channels=True)
@@ -0,0 +1,92 @@
+import asyncio
+import time
+import discord
+import logging
+
+log = logging.getLogger(__name__)
+
+MUTED_OVERWRITE = {"send_messages": False}
+PROVISION_CONCURRENCY = 5  # Channel edits in flight per guild; discord.py queues each route's rate-limit bucket
+PROGRESS_INTERVAL = 2  # Minimum seconds between progress callbacks
+
+
+def needs_overwrite(channel, role):
+    """Returns True if the channel does not already deny the muted permissions to `role`."""
+    overwrite = channel.overwrites_for(role)
+    return any(getattr(overwrite, perm) != value for perm, value in MUTED_OVERWRITE.items())
+
+
+class MuteRoleProvisioner:
+    """Applies the Muted role's channel overwrites in the background, one job per guild.
+
+    Categories are updated first. Channels synced to a category are then re-synced with it instead
+    of getting their own overwrite, so they stay synced. Channels that already deny the permissions
+    are skipped, which makes re-running a job cheap.
+    """
+
+    def __init__(self, concurrency=PROVISION_CONCURRENCY):
+        self.concurrency = concurrency
+        self.jobs = {}  # guild_id -> running provisioning task
+
+    def provision(self, guild, role, progress=None):
+        """Starts (or returns the already running) provisioning task for a guild.
+
+        `progress(done, total)` is awaited as channels complete, throttled to PROGRESS_INTERVAL.
+        The task's result is an (applied, skipped, failed) tuple.
+        """
+        task = self.jobs.get(guild.id)
+        if task is None or task.done():
+            task = asyncio.get_running_loop().create_task(self._provision(guild, role, progress))
+            self.jobs[guild.id] = task
+
+            def forget(finished):
+                if self.jobs.get(guild.id) is finished:
+                    del self.jobs[guild.id]
+            task.add_done_callback(forget)
+        return task
+
+    async def apply_to_channel(self, channel, role):
+        """Brings one channel (e.g. a newly created one) in line with the Muted role."""
+        if not needs_overwrite(channel, role):
+            return False
+        if channel.category is not None and channel.permissions_synced and not needs_overwrite(channel.category, role):
+            await channel.edit(sync_permissions=True)
+        else:
+            await channel.set_permissions(role, **MUTED_OVERWRITE)
+        return True
+
+    async def _provision(self, guild, role, progress):
+        # Sync state has to be read before categories change, or every child looks out of sync
+        synced = {channel.id for channel in guild.channels if channel.category is not None and channel.permissions_synced}
+        categories = [category for category in guild.categories if needs_overwrite(category, role)]
+        channels = [
+            channel for channel in guild.channels
+            if not isinstance(channel, discord.CategoryChannel) and needs_overwrite(channel, role)
+        ]
+        total = len(categories) + len(channels)
+        skipped = len(guild.channels) - total
+        done = failed = 0
+        last_report = 0.0
+        limiter = asyncio.Semaphore(self.concurrency)
+
+        async def apply(channel, sync):
+            nonlocal done, failed, last_report
+            async with limiter:
+                try:
+                    if sync:
+                        await channel.edit(sync_permissions=True)
+                    else:
+                        await channel.set_permissions(role, **MUTED_OVERWRITE)
+                except discord.HTTPException as e:
+                    failed += 1
+                    log.warning(f"Failed to set Muted overwrite on {channel} in {guild}: {e}")
+            done += 1
+            if progress and time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                last_report = time.monotonic()
+                await progress(done, total)
+
+        await asyncio.gather(*(apply(category, sync=False) for category in categories))
+        await asyncio.gather(*(apply(channel, sync=channel.id in synced) for channel in channels))
+        if progress:
+            await progress(done, total)
+        return total - failed, skipped, failed
@@ -0,0 +1,146 @@
+import asyncio
+import os
+import discord
+import db
+from mass_actions import is_retryable
+import logging
+
+log = logging.getLogger(__name__)
+
+NOTIFY_CONCURRENCY = int(os.getenv("NOTIFY_CONCURRENCY", 10))  # DMs in flight across all giveaways
+NOTIFY_RETRIES = 3
+NOTIFY_READ_RETRY_DELAY = 60  # Seconds before a job retries a failed read of its subscribers
+DM_CLOSED = 50007  # "Cannot send messages to this user": DMs disabled or the bot is blocked
+
+
+class DeliveryState:
+    """Progress of one giveaway's notifications."""
+
+    def __init__(self, cursor=0):
+        self.cursor = cursor  # Highest subscriber user ID handled so far
+        self.sent = 0
+        self.closed = 0
+        self.failed = 0
+        self.done = False
+
+    def summary(self):
+        summary = f"{self.sent} sent, {self.closed} closed DMs, {self.failed} failed"
+        return summary if self.done else summary + " (sending)"
+
+
+class NotificationDispatcher:
+    """DMs a guild's giveaway subscribers when a giveaway starts.
+
+    Each giveaway gets a job that walks the subscribers in user ID order, one page at a time, and hands
+    every DM to a fixed pool of workers through a bounded queue. Memory and requests in flight stay flat
+    however many subscribers a guild has, and several giveaways share the same workers. After each page
+    the job saves its cursor on the giveaway row, so a restart resumes where it stopped. A rate limit
+    that outlives discord.py's own retries pauses every worker, not just the one that hit it.
+    """
+
+    def __init__(self, bot, concurrency=NOTIFY_CONCURRENCY):
+        self.bot = bot
+        self.concurrency = concurrency
+        self.states = {}  # message_id -> DeliveryState
+        self._jobs = {}  # message_id -> job task
+        self._queue = None
+        self._workers = []
+        self._paused_until = 0.0  # Loop time before which no worker sends
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        self._workers = [loop.create_task(self._work()) for _ in range(self.concurrency)]
+
+    def stop(self):
+        for task in [*self._jobs.values(), *self._workers]:
+            task.cancel()
+        self._jobs, self._workers = {}, []
+
+    def notify(self, message_id, guild_id, content, cursor=0):
+        """Starts DMing `content` to the guild's subscribers, or resumes after user ID `cursor`."""
+        state = self.states[message_id] = DeliveryState(cursor)
+        self._jobs[message_id] = asyncio.get_running_loop().create_task(
+            self._run_job(message_id, guild_id, content, state)
+        )
+
+    def cancel(self, message_id):
+        """Stops a giveaway's notifications, e.g. when it ends or is cancelled before they finish."""
+        task = self._jobs.pop(message_id, None)
+        if task is not None:
+            task.cancel()
+        self.states.pop(message_id, None)
+
+    async def _run_job(self, message_id, guild_id, content, state):
+        await self.bot.wait_until_ready()
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                user_ids = await db.get_giveaway_subscribers(guild_id, state.cursor)
+                if user_ids is None:
+                    # Keep the cursor and try again rather than skip the remaining subscribers
+                    log.warning(f"Could not read subscribers for giveaway {message_id}, retrying in {NOTIFY_READ_RETRY_DELAY}s.")
+                    await asyncio.sleep(NOTIFY_READ_RETRY_DELAY)
+                    continue
+                if not user_ids:
+                    break
+                results = [loop.create_future() for _ in user_ids]
+                try:
+                    for user_id, result in zip(user_ids, results):
+                        await self._queue.put((user_id, content, result))  # Waits while the workers are busy
+                    outcomes = await asyncio.gather(*results)
+                finally:
+                    for result in results:
+                        result.cancel()  # No-op once resolved; otherwise the workers skip it
+
+                state.sent += outcomes.count("sent")
+                state.failed += outcomes.count("failed")
+                closed = [user_id for user_id, outcome in zip(user_ids, outcomes) if outcome == "closed"]
+                state.closed += len(closed)
+                await db.mark_dms_closed(guild_id, closed)
+                state.cursor = user_ids[-1]
+                await db.set_notify_cursor(message_id, state.cursor)
+
+            state.done = True
+            await db.set_notify_cursor(message_id, None)
+            log.info(f"Giveaway {message_id} notifications finished: {state.summary()}.")
+        finally:
+            if self._jobs.get(message_id) is asyncio.current_task():
+                del self._jobs[message_id]
+
+    async def _work(self):
+        while True:
+            user_id, content, result = await self._queue.get()
+            if result.done():
+                continue  # The job was cancelled
+            try:
+                outcome = await self._deliver(user_id, content)
+            except Exception as e:
+                log.error(f"Error notifying user {user_id}: {e}")
+                outcome = "failed"
+            if not result.done():
+                result.set_result(outcome)
+
+    async def _deliver(self, user_id, content):
+        """Sends one DM. Returns "sent", "closed" (DMs closed or account gone) or "failed"."""
+        loop = asyncio.get_running_loop()
+        for attempt in range(1, NOTIFY_RETRIES + 1):
+            delay = self._paused_until - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                channel = await self.bot.create_dm(discord.Object(id=user_id))
+                await channel.send(content)
+                return "sent"
+            except discord.NotFound:
+                return "closed"
+            except discord.HTTPException as e:
+                if e.code == DM_CLOSED:
+                    return "closed"
+                if not is_retryable(e) or attempt == NOTIFY_RETRIES:
+                    log.warning(f"Failed to notify user {user_id}: {e}")
+                    return "failed"
+                backoff = 2 ** attempt
+                if e.status == 429:
+                    self._paused_until = max(self._paused_until, loop.time() + backoff)
+                await asyncio.sleep(backoff)
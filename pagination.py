@@ -0,0 +1,65 @@
+import discord
+
+
+class Paginator(discord.ui.View):
+    """Previous/Next buttons that render one page at a time.
+
+    `fetch_page(cursor)` is awaited for every page shown and must return `(embed, next_cursor)`,
+    with `next_cursor` set to None on the last page. Cursors of pages already seen are kept so
+    "Previous" can go back without the source supporting reverse scans.
+    """
+
+    def __init__(self, author_id, fetch_page, timeout=120):
+        super().__init__(timeout=timeout)
+        self.author_id = author_id
+        self.fetch_page = fetch_page
+        self.cursors = [None]  # Cursor that produced each page seen so far
+        self.next_cursor = None
+        self.message = None
+
+    async def start(self, ctx, first_page=None):
+        """Sends the first page, with buttons only if there is more than one page.
+
+        Pass `first_page` when the caller already fetched it (e.g. to check for an empty result).
+        """
+        embed, self.next_cursor = first_page or await self.fetch_page(None)
+        self._update_buttons()
+        if self.next_cursor is None:
+            self.stop()
+            self.message = await ctx.send(embed=embed)
+        else:
+            embed.set_footer(text="Page 1")
+            self.message = await ctx.send(embed=embed, view=self)
+
+    def _update_buttons(self):
+        self.previous.disabled = len(self.cursors) == 1
+        self.next.disabled = self.next_cursor is None
+
+    async def _show(self, interaction, cursor):
+        embed, self.next_cursor = await self.fetch_page(cursor)
+        embed.set_footer(text=f"Page {len(self.cursors)}")
+        self._update_buttons()
+        await interaction.response.edit_message(embed=embed, view=self)
+
+    async def interaction_check(self, interaction):
+        if interaction.user.id != self.author_id:
+            await interaction.response.send_message("Only the person who ran the command can change pages.", ephemeral=True)
+            return False
+        return True
+
+    async def on_timeout(self):
+        if self.message:
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass
+
+    @discord.ui.button(label="Previous", style=discord.ButtonStyle.secondary)
+    async def previous(self, interaction, button):
+        self.cursors.pop()
+        await self._show(interaction, self.cursors[-1])
+
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.secondary)
+    async def next(self, interaction, button):
+        self.cursors.append(self.next_cursor)
+        await self._show(interaction, self.next_cursor)
@@ -0,0 +1,98 @@
+import asyncio
+from datetime import timedelta
+import discord
+import logging
+
+log = logging.getLogger(__name__)
+
+BULK_DELETE_MAX = 100  # Most messages Discord deletes in one bulk request
+BULK_DELETE_MAX_AGE = timedelta(days=14, minutes=-5)  # Older messages can't be bulk deleted; keep a margin
+OLD_DELETE_DELAY = 1.0  # Seconds between single deletes of old messages, which have a tight rate limit
+DEFAULT_SCAN_LIMIT = 5000  # Messages scanned per channel when filters are set
+CHANNEL_CONCURRENCY = 3  # Channels purged at once; each has its own rate-limit bucket
+PROGRESS_INTERVAL = 3  # Seconds between progress message edits
+
+
+class PurgeStats:
+    """Running totals for one purge, shared by every channel worker and read by the progress reporter."""
+
+    def __init__(self):
+        self.scanned = 0
+        self.deleted = 0
+        self.failed = 0
+
+
+def build_check(user=None, pattern=None, attachments=False, bots=False):
+    """Combines the purge filters into one predicate; a message must match every filter given."""
+    def check(message):
+        if user is not None and message.author.id != user.id:
+            return False
+        if bots and not message.author.bot:
+            return False
+        if attachments and not message.attachments:
+            return False
+        if pattern is not None and not pattern.search(message.content):
+            return False
+        return True
+    return check
+
+
+async def purge_channel(channel, check, limit, stats, scan_limit=None, before=None, after=None):
+    """Streams a channel's history newest first and deletes up to `limit` matching messages.
+
+    Matches are bulk deleted as each group of 100 fills. Once the scan reaches messages too old for
+    bulk deletion, the rest are deleted one at a time with a delay between requests.
+    """
+    bulk_cutoff = discord.utils.utcnow() - BULK_DELETE_MAX_AGE
+    batch = []
+    matched = 0
+
+    async def flush():
+        nonlocal batch
+        if not batch:
+            return
+        try:
+            await channel.delete_messages(batch)
+            stats.deleted += len(batch)
+        except discord.HTTPException as e:
+            stats.failed += len(batch)
+            log.warning(f"Bulk delete of {len(batch)} messages failed in {channel}: {e}")
+        batch = []
+
+    # oldest_first must be explicit: discord.py flips to oldest first whenever `after` is given
+    async for message in channel.history(limit=scan_limit, before=before, after=after, oldest_first=False):
+        stats.scanned += 1
+        if not check(message):
+            continue
+        matched += 1
+
+        if message.created_at > bulk_cutoff:
+            batch.append(message)
+            if len(batch) == BULK_DELETE_MAX:
+                await flush()
+        else:
+            await flush()  # History is newest first, so nothing bulk-deletable is left behind
+            try:
+                await message.delete()
+                stats.deleted += 1
+            except discord.NotFound:
+                pass  # Already gone
+            except discord.HTTPException as e:
+                stats.failed += 1
+                log.warning(f"Deleting message {message.id} failed in {channel}: {e}")
+            await asyncio.sleep(OLD_DELETE_DELAY)
+
+        if matched >= limit:
+            break
+    await flush()
+
+
+async def purge_channels(channels, check, limit, stats, scan_limit=None, before=None, after=None):
+    """Purges several channels with bounded concurrency, `limit` matching messages per channel."""
+    limiter = asyncio.Semaphore(CHANNEL_CONCURRENCY)
+
+    async def run(channel):
+        async with limiter:
+            await purge_channel(channel, check, limit, stats, scan_limit, before, after)
+
+    await asyncio.gather(*(run(channel) for channel in channels))
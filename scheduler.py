@@ -0,0 +1,92 @@
+import asyncio
+import heapq
+import itertools
+import time
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class Scheduler:
+    """Runs a callback when keys come due, from one task sleeping on a min-heap of due times.
+
+    `callback(keys)` is awaited with every key that came due together, so callers can handle a
+    burst in one batch. Due times are Unix timestamps, which lets them be persisted and reloaded.
+    Cancelled or rescheduled entries are left in the heap and skipped when they surface.
+    """
+
+    def __init__(self, callback, name="scheduler"):
+        self.callback = callback
+        self.name = name
+        self._heap = []  # (due_at, seq, key)
+        self._due = {}  # key -> due_at of its live heap entry
+        self._seq = itertools.count()  # Tie-breaker so keys never need to be comparable
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._dispatches = set()
+
+    def schedule(self, key, due_at):
+        """Schedules (or reschedules) `key` to fire at the Unix timestamp `due_at`."""
+        self._due[key] = due_at
+        heapq.heappush(self._heap, (due_at, next(self._seq), key))
+        if self._heap[0][2] == key:
+            self._wakeup.set()  # New earliest entry, re-arm the sleep
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def cancel(self, key):
+        """Removes a pending key. Returns False if it was not scheduled."""
+        return self._due.pop(key, None) is not None
+
+    def due_at(self, key):
+        return self._due.get(key)
+
+    def __contains__(self, key):
+        return key in self._due
+
+    def __len__(self):
+        return len(self._due)
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            # Discard entries that were cancelled or superseded by a reschedule
+            while self._heap and self._due.get(self._heap[0][2]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+
+            if not self._heap:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            delay = self._heap[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            now = time.time()
+            keys = []
+            while self._heap and self._heap[0][0] <= now:
+                due_at, _, key = heapq.heappop(self._heap)
+                if self._due.get(key) == due_at:
+                    del self._due[key]
+                    keys.append(key)
+            if keys:
+                # Dispatch in the background so a slow batch never delays the next due time
+                task = asyncio.get_running_loop().create_task(self._dispatch(keys))
+                self._dispatches.add(task)
+                task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, keys):
+        try:
+            await self.callback(keys)
+        except Exception as e:
+            log.error(f"Error in {self.name} callback for {len(keys)} due entries: {e}")
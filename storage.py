@@ -0,0 +1,227 @@
+"""Storage backends behind db.py: MySQL through a connection pool, or a local SQLite file.
+
+Both hand out connections that behave like pooled mysql.connector ones (`cursor(dictionary=True)`,
+`commit()`, `close()` to give them back), so the queries in db.py run unchanged on either. Queries use
+`%s` placeholders; dialect differences go through the backend (`upsert()`, `migration_lock()`).
+"""
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime
+from functools import lru_cache
+import mysql.connector
+from mysql.connector import pooling
+import logging
+
+log = logging.getLogger(__name__)
+
+MIGRATION_LOCK_TIMEOUT = 60  # Seconds to wait for another process that is migrating
+SQLITE_BUSY_TIMEOUT = 30  # Seconds a connection waits on a locked database before erroring
+MYSQL_TRANSIENT_ERRNOS = {1205, 1213}  # Lock wait timeout, deadlock
+MYSQL_TIME_ZONE = "+00:00"  # TIMESTAMP columns are read and compared in UTC, like the naive datetimes in db.py
+
+# Dates and datetimes are stored as ISO text and come back as naive values, like MySQL's columns
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+sqlite3.register_converter("DATE", lambda value: date.fromisoformat(value.decode()))
+sqlite3.register_converter("DATETIME", lambda value: datetime.fromisoformat(value.decode()))
+sqlite3.register_converter("TIMESTAMP", lambda value: datetime.fromisoformat(value.decode()))
+
+
+class MySQLBackend:
+    name = "mysql"
+    Error = mysql.connector.Error
+    writer = None  # Writes share the pool's worker threads with reads
+
+    def __init__(self, pool_name, pool_size, reconnect_attempts, reconnect_delay, **connect_args):
+        self.pool_name = pool_name
+        self.pool_size = pool_size
+        self.reconnect_attempts = reconnect_attempts
+        self.reconnect_delay = reconnect_delay
+        self.connect_args = connect_args
+        self._pool = None
+
+    def get_pool(self):
+        """Creates the shared connection pool on first use and returns it."""
+        if self._pool is None:
+            self._pool = pooling.MySQLConnectionPool(
+                pool_name=self.pool_name,
+                pool_size=self.pool_size,
+                pool_reset_session=True,
+                **self.connect_args
+            )
+            log.info(f"Database pool created with {self.pool_size} connections.")
+        return self._pool
+
+    def connect(self):
+        """Checks a connection out of the pool, reconnecting it if it has gone stale."""
+        try:
+            db = self.get_pool().get_connection()
+            # Health check: a dead socket (server restart, wait_timeout) is reopened here
+            db.ping(reconnect=True, attempts=self.reconnect_attempts, delay=self.reconnect_delay)
+            # Set on every checkout: the pool resets the session when a connection is given back
+            cursor = db.cursor()
+            cursor.execute("SET time_zone = %s", (MYSQL_TIME_ZONE,))
+            cursor.close()
+            return db
+        except mysql.connector.Error as err:
+            log.warning(f"Database connection error: {err}")
+            return None
+
+    def upsert(self, keys, columns, add=False):
+        """The clause that turns an INSERT into an update of `columns` when the row already exists.
+
+        With `add`, the new values are added to the stored ones instead of replacing them.
+        """
+        base = "{0} + " if add else ""
+        return "ON DUPLICATE KEY UPDATE " + ", ".join(
+            f"{column} = {base.format(column)}VALUES({column})" for column in columns
+        )
+
+    @contextmanager
+    def migration_lock(self, db):
+        """A named lock keeps clustered processes that start together from migrating at the same time."""
+        cursor = db.cursor()
+        cursor.execute("SELECT GET_LOCK('schema_migrations', %s)", (MIGRATION_LOCK_TIMEOUT,))
+        locked = cursor.fetchone()[0] == 1
+        try:
+            yield locked
+        finally:
+            if locked:
+                cursor.execute("SELECT RELEASE_LOCK('schema_migrations')")
+                cursor.fetchone()
+
+    def connection_error(self, message):
+        """The error to raise when no connection could be had, so callers catching `Error` see it."""
+        return mysql.connector.errors.OperationalError(message)
+
+    def is_transient(self, err):
+        if isinstance(err, (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError)):
+            return True
+        return getattr(err, "errno", None) in MYSQL_TRANSIENT_ERRNOS
+
+    def close(self):
+        pass  # Pooled connections close with the process
+
+
+@lru_cache(maxsize=None)
+def _sqlite_query(query):
+    return query.replace("%s", "?")
+
+
+class SQLiteCursor:
+    def __init__(self, cursor, dictionary):
+        self._cursor = cursor
+        self._dictionary = dictionary
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def execute(self, query, params=()):
+        self._cursor.execute(_sqlite_query(query), tuple(params))
+
+    def executemany(self, query, rows):
+        self._cursor.executemany(_sqlite_query(query), rows)
+
+    def _convert(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return {column[0]: value for column, value in zip(self._cursor.description, row)}
+
+    def fetchone(self):
+        return self._convert(self._cursor.fetchone())
+
+    def fetchmany(self, size):
+        return [self._convert(row) for row in self._cursor.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._convert(row) for row in self._cursor.fetchall()]
+
+
+class SQLiteConnection:
+    """A thread's SQLite connection, wrapped to look like a pooled MySQL one."""
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._deferred = False  # Set while migrating, so the whole run commits once
+
+    def cursor(self, dictionary=False, buffered=False):
+        # SQLite cursors always step through results lazily, so `buffered` has nothing to change
+        return SQLiteCursor(self._conn.cursor(), dictionary)
+
+    def commit(self):
+        if not self._deferred:
+            self._conn.commit()
+
+    def close(self):
+        # The connection stays open for this thread's next query; only unfinished work is dropped
+        if self._conn.in_transaction:
+            self._conn.rollback()
+
+
+class SQLiteBackend:
+    """A single SQLite file in WAL mode.
+
+    Readers use one connection per worker thread and never block on the writer. Every write runs on
+    one dedicated writer thread (`writer`), so writes are serialised in-process instead of contending
+    for SQLite's database lock.
+    """
+    name = "sqlite"
+    Error = sqlite3.Error
+
+    def __init__(self, path):
+        self.path = path
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-writer")
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            raw = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT, detect_types=sqlite3.PARSE_DECLTYPES,
+                                  check_same_thread=False)
+            raw.execute("PRAGMA journal_mode=WAL")
+            raw.execute("PRAGMA synchronous=NORMAL")  # Durable across app crashes; WAL keeps it consistent
+            raw.create_function("MOD", 2, lambda a, b: a % b, deterministic=True)
+            conn = self._local.conn = SQLiteConnection(raw)
+            with self._lock:
+                self._connections.append(raw)
+        return conn
+
+    def upsert(self, keys, columns, add=False):
+        base = "{0} + " if add else ""
+        updates = ", ".join(f"{column} = {base.format(column)}excluded.{column}" for column in columns)
+        return f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}"
+
+    @contextmanager
+    def migration_lock(self, db):
+        """Holds SQLite's write lock for the whole run. DDL is transactional here, so pending
+        migrations apply all together or not at all."""
+        raw = db._conn
+        raw.execute("BEGIN IMMEDIATE")
+        db._deferred = True
+        try:
+            yield True
+        except BaseException:
+            raw.rollback()
+            raise
+        else:
+            raw.commit()
+        finally:
+            db._deferred = False
+
+    def connection_error(self, message):
+        return sqlite3.OperationalError(message)
+
+    def is_transient(self, err):
+        return isinstance(err, sqlite3.OperationalError) and ("locked" in str(err) or "busy" in str(err))
+
+    def close(self):
+        self.writer.shutdown(wait=True)
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
@@ -0,0 +1,79 @@
+import asyncio
+import discord
+import db
+import logging
+
+log = logging.getLogger(__name__)
+
+BATCH_SIZE = 100  # Due actions fetched and executed per round
+MAX_SLEEP = 300  # Re-check the table at least this often (seconds), e.g. for rows added by other processes
+RETRY_DELAY = 30  # Seconds to wait before retrying when executed actions could not be removed
+
+
+class TimedActionDispatcher:
+    """Executes scheduled moderation actions (e.g. unmutes) stored in the scheduled_actions table.
+
+    The table, indexed on due_at, is the queue: the dispatcher only ever holds one batch in memory
+    and runs as a single task, however many actions are pending. `handlers` maps an action name
+    to a coroutine taking the action's row. `shards` is a (shard_count, shard_ids) pair when this
+    process only runs some shards, so that each clustered process handles only its own guilds.
+    """
+
+    def __init__(self, handlers, batch_size=BATCH_SIZE, shards=None):
+        self.handlers = handlers
+        self.shards = shards
+        self.batch_size = batch_size
+        self._wakeup = asyncio.Event()
+        self._next_due = None  # Due time the dispatcher is currently sleeping towards
+        self._task = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def schedule(self, guild_id, user_id, action, due_at, role_id=None, channel_id=None):
+        """Stores an action to run at `due_at` (a UTC datetime), replacing any pending one of the same kind."""
+        await db.cancel_actions(guild_id, user_id, action)
+        await db.schedule_action(guild_id, user_id, action, due_at, role_id, channel_id)
+        if self._next_due is None or due_at < self._next_due:
+            self._wakeup.set()
+
+    async def cancel(self, guild_id, user_id, action):
+        await db.cancel_actions(guild_id, user_id, action)
+
+    async def _run(self):
+        while True:
+            rows = await db.get_due_actions(discord.utils.utcnow(), self.batch_size, self.shards)
+            if rows:
+                await asyncio.gather(*(self._execute(row) for row in rows))
+                if await db.delete_actions([row["id"] for row in rows]):
+                    continue  # More may have come due together
+                # Couldn't delete them; back off instead of re-running the batch in a tight loop
+                self._next_due = None
+                delay = RETRY_DELAY
+            else:
+                self._next_due = await db.get_next_action_due(self.shards)
+                delay = MAX_SLEEP
+            if self._next_due is not None:
+                delay = min(max((self._next_due - discord.utils.utcnow()).total_seconds(), 0), MAX_SLEEP)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            self._next_due = None
+
+    async def _execute(self, row):
+        handler = self.handlers.get(row["action"])
+        if handler is None:
+            log.warning(f"No handler for scheduled action {row['action']} (id {row['id']}), dropping it.")
+            return
+        try:
+            await handler(row)
+        except Exception as e:
+            log.error(f"Error running scheduled {row['action']} for user {row['user_id']}: {e}")